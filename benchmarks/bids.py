@@ -0,0 +1,65 @@
+# emacs: -*- mode: python; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Benchmarks for the BIDS metadata extractors"""
+
+import tempfile
+from shutil import rmtree
+
+from bids import BIDSLayout
+from datalad.api import Dataset
+
+from datalad_neuroimaging.extractors.bids import MetadataExtractor
+from datalad_neuroimaging.extractors.bids_dataset import BIDSmeta
+
+from .generators import make_bids_dataset
+
+
+class ContentMetadata:
+    """Content metadata extraction for a dataset with many subjects"""
+    params = [100, 1000]
+    param_names = ['subjects']
+    timeout = 600
+
+    def setup(self, n_subjects):
+        self.path = tempfile.mkdtemp()
+        self.files = make_bids_dataset(self.path, n_subjects)
+        self.layout = BIDSLayout(self.path)
+        self.extractor = MetadataExtractor(Dataset(self.path), self.files)
+
+    def teardown(self, n_subjects):
+        rmtree(self.path)
+
+    def time_get_cnmeta(self, n_subjects):
+        for f, md in self.extractor._get_cnmeta(self.layout):
+            pass
+
+
+class Metadata:
+    """Metadata extraction, including the indexing of the dataset"""
+    params = ([10, 100], [0, 2])
+    param_names = ['subjects', 'sessions']
+    timeout = 600
+
+    def setup(self, n_subjects, n_sessions):
+        self.path = tempfile.mkdtemp()
+        self.files = make_bids_dataset(
+            self.path, n_subjects, n_sessions=n_sessions, n_runs=2)
+        self.ds = Dataset(self.path)
+
+    def teardown(self, n_subjects, n_sessions):
+        rmtree(self.path)
+
+    def time_bids(self, n_subjects, n_sessions):
+        dsmeta, cnmeta = MetadataExtractor(
+            self.ds, self.files).get_metadata(True, True)
+        for f, md in cnmeta:
+            pass
+
+    def time_bids_dataset(self, n_subjects, n_sessions):
+        BIDSmeta(self.ds).get_metadata()
@@ -0,0 +1,201 @@
+# emacs: -*- mode: python; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Benchmarks for the conversion of BIDS metadata to ISA-Tab"""
+
+import os.path as op
+import tempfile
+from shutil import rmtree
+
+from datalad.api import Dataset
+
+from datalad_neuroimaging.bids2scidata import (
+    _describe_files,
+    _index_by_suffix,
+    _iter_metadata,
+    _TermResolver,
+    convert,
+)
+
+from .generators import (
+    make_bids_dataset,
+    make_scidata_metadata,
+)
+
+
+class Convert:
+    """Conversion of the metadata of a dataset with two sessions per subject"""
+    params = ([10, 100, 1000], [None, 2])
+    param_names = ['subjects', 'jobs']
+    timeout = 600
+
+    def setup(self, n_subjects, jobs):
+        self.path = tempfile.mkdtemp()
+        self.dsmeta, self.filemeta = make_scidata_metadata(
+            op.join(self.path, 'ds'), n_subjects, n_sessions=2, n_runs=4,
+            defacemask=True)
+
+    def teardown(self, n_subjects, jobs):
+        rmtree(self.path)
+
+    def time_convert(self, n_subjects, jobs):
+        convert(
+            self.dsmeta,
+            self.filemeta,
+            op.join(self.path, 'isatab'),
+            repository_info={
+                'Comment[Data Repository]': 'synthetic',
+                'Comment[Data Record Accession]': 'ds000000',
+                'Comment[Data Record URI]': 'https://example.com'},
+            jobs=jobs)
+
+
+class ConvertChunks:
+    """Conversion with and without holding entire assay tables in memory"""
+    params = ([1000, 4000], [None, 1000])
+    param_names = ['subjects', 'chunk_size']
+    timeout = 600
+
+    def setup(self, n_subjects, chunk_size):
+        self.path = tempfile.mkdtemp()
+        self.dsmeta, self.filemeta = make_scidata_metadata(
+            op.join(self.path, 'ds'), n_subjects, n_sessions=2, n_runs=4,
+            defacemask=True)
+
+    def teardown(self, n_subjects, chunk_size):
+        rmtree(self.path)
+
+    def _convert(self, chunk_size):
+        convert(
+            self.dsmeta,
+            self.filemeta,
+            tempfile.mkdtemp(dir=self.path),
+            repository_info={
+                'Comment[Data Repository]': 'synthetic',
+                'Comment[Data Record Accession]': 'ds000000',
+                'Comment[Data Record URI]': 'https://example.com'},
+            chunk_size=chunk_size)
+
+    def time_convert(self, n_subjects, chunk_size):
+        self._convert(chunk_size)
+
+    def peakmem_convert(self, n_subjects, chunk_size):
+        self._convert(chunk_size)
+
+
+class ConvertManyFiles:
+    """Conversion of the metadata of a dataset with many non-image files
+
+    Only few of the records describe images, but all records need to be
+    looked at to find them.
+    """
+    params = [1000000]
+    param_names = ['files']
+    timeout = 600
+
+    def setup(self, n_files):
+        self.path = tempfile.mkdtemp()
+        ds_path = op.join(self.path, 'ds')
+        self.dsmeta, self.filemeta = make_scidata_metadata(
+            ds_path, 10, n_sessions=2, n_runs=4, defacemask=True)
+        self.filemeta.extend(
+            {'path': op.join(ds_path, 'stimuli', 'stim{:07d}.png'.format(i)),
+             'parentds': ds_path,
+             'type': 'file',
+             'metadata': {} if i % 2 else {'bids': {'suffix': 'events'}}}
+            for i in range(n_files - len(self.filemeta)))
+
+    def teardown(self, n_files):
+        rmtree(self.path)
+
+    def time_convert(self, n_files):
+        convert(
+            self.dsmeta,
+            self.filemeta,
+            op.join(self.path, 'isatab'),
+            repository_info={
+                'Comment[Data Repository]': 'synthetic',
+                'Comment[Data Record Accession]': 'ds000000',
+                'Comment[Data Record URI]': 'https://example.com'})
+
+
+class IndexFiles:
+    """Ingestion of file records with many properties not used in tables"""
+    params = [10000, 100000]
+    param_names = ['files']
+
+    def setup(self, n_files):
+        self.dsmeta, self.filemeta = make_scidata_metadata(
+            '/ds', 100, n_sessions=2, n_runs=4)
+
+    def _iter_records(self, n_files):
+        # like the records of a metadata query, each one is new
+        for i in range(n_files):
+            f = self.filemeta[i % len(self.filemeta)]
+            yield dict(f, metadata=dict(
+                f['metadata'],
+                dicom={'Tag{:03d}'.format(j): 'value' for j in range(100)}))
+
+    def time_index_by_suffix(self, n_files):
+        _index_by_suffix(self._iter_records(n_files))
+
+    def peakmem_index_by_suffix(self, n_files):
+        _index_by_suffix(self._iter_records(n_files))
+
+
+class TermResolution:
+    """Description of files in chunks, with term sources resolved once"""
+    params = [100, 1000]
+    param_names = ['subjects']
+
+    def setup(self, n_subjects):
+        self.dsmeta, filemeta = make_scidata_metadata(
+            '/ds', n_subjects, n_sessions=2, n_runs=4)
+        self.index = _index_by_suffix(filemeta)
+
+    def _describe(self):
+        resolver = _TermResolver(self.dsmeta)
+        for files in self.index.values():
+            for i in range(0, len(files), 100):
+                _describe_files(self.dsmeta, files[i:i + 100], resolver)
+        return resolver
+
+    def time_describe_files(self, n_subjects):
+        self._describe()
+
+    def track_cache_hits(self, n_subjects):
+        return self._describe().hits
+
+    def track_cache_misses(self, n_subjects):
+        return self._describe().misses
+
+
+class QuerySubdatasets:
+    """Metadata query of a superdataset with many BIDS subdatasets"""
+    params = [None, 4]
+    param_names = ['jobs']
+    timeout = 1200
+
+    def setup_cache(self):
+        # creating and aggregating the datasets takes much longer than the
+        # query, do it once for all parameters
+        path = tempfile.mkdtemp()
+        ds = Dataset(path).create()
+        for i in range(8):
+            subpath = op.join(path, 'sub{}'.format(i))
+            make_bids_dataset(subpath, 50, n_sessions=2, n_runs=2)
+            subds = ds.create(subpath, force=True)
+            subds.config.add(
+                'datalad.metadata.nativetype', 'bids', scope='branch')
+        ds.save(recursive=True)
+        ds.aggregate_metadata(recursive=True, update_mode='all')
+        return path
+
+    def time_iter_metadata(self, path, jobs):
+        for m in _iter_metadata(None, Dataset(path), jobs):
+            pass
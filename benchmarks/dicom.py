@@ -0,0 +1,43 @@
+# emacs: -*- mode: python; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Benchmarks for the DICOM metadata extractor"""
+
+import tempfile
+from shutil import rmtree
+
+from datalad.api import Dataset
+
+from datalad_neuroimaging.extractors.dicom import MetadataExtractor
+
+from .generators import make_dicom_series
+
+
+class Metadata:
+    """Metadata extraction from ten image series"""
+    params = ([10, 100], [0, 100])
+    param_names = ['slices', 'private_tags']
+    timeout = 600
+
+    def setup(self, n_slices, n_private_tags):
+        self.path = tempfile.mkdtemp()
+        self.files = make_dicom_series(
+            self.path, n_series=10, n_slices=n_slices,
+            n_private_tags=n_private_tags)
+        self.extractor = MetadataExtractor(Dataset(self.path), self.files)
+
+    def teardown(self, n_slices, n_private_tags):
+        rmtree(self.path)
+
+    def time_dataset(self, n_slices, n_private_tags):
+        self.extractor.get_metadata(True, False)
+
+    def time_content(self, n_slices, n_private_tags):
+        dsmeta, cnmeta = self.extractor.get_metadata(True, True)
+        for f, md in cnmeta:
+            pass
@@ -0,0 +1,345 @@
+# emacs: -*- mode: python; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Generators of synthetic data for benchmarks
+
+None of them needs network access. All file generators return the paths of
+the created files relative to the target directory, in the form that is
+passed on to metadata extractors.
+"""
+
+import json
+import os
+import os.path as op
+
+# MR Image Storage
+_mr_sop_class_uid = '1.2.840.10008.5.1.4.1.1.4'
+# root for all generated UIDs, made unique per file with a suffix
+_uid_root = '1.2.826.0.1.3680043.9.7632'
+
+
+def make_dicom_series(path, n_series=1, n_slices=10, n_private_tags=0,
+                      matrix=(16, 16)):
+    """Create DICOM files for one or more MR image series
+
+    Parameters
+    ----------
+    path : str
+      Target directory, each series is placed in its own subdirectory.
+    n_series : int
+    n_slices : int
+      Number of images (one file each) per series.
+    n_private_tags : int
+      Number of tags to add to a private block of each image.
+    matrix : tuple
+      Number of rows and columns of each image.
+
+    Returns
+    -------
+    list
+    """
+    import pydicom
+    from pydicom.dataset import Dataset, FileMetaDataset
+    from pydicom.uid import ExplicitVRLittleEndian
+
+    legacy = int(pydicom.__version__.split('.')[0]) < 3
+
+    rows, cols = matrix
+    pixels = bytes(rows * cols * 2)
+    study_uid = '{}.1'.format(_uid_root)
+    files = []
+    for series in range(n_series):
+        series_uid = '{}.2.{}'.format(_uid_root, series)
+        os.makedirs(op.join(path, 'series{:03d}'.format(series)),
+                    exist_ok=True)
+        for image in range(n_slices):
+            instance_uid = '{}.3.{}.{}'.format(_uid_root, series, image)
+            meta = FileMetaDataset()
+            meta.MediaStorageSOPClassUID = _mr_sop_class_uid
+            meta.MediaStorageSOPInstanceUID = instance_uid
+            meta.TransferSyntaxUID = ExplicitVRLittleEndian
+            d = Dataset()
+            d.file_meta = meta
+            d.SOPClassUID = _mr_sop_class_uid
+            d.SOPInstanceUID = instance_uid
+            d.Modality = 'MR'
+            d.Manufacturer = 'SYNTHETIC'
+            d.PatientID = 'sub{:03d}'.format(series % 10)
+            d.PatientName = 'Doe^Jane'
+            d.StudyInstanceUID = study_uid
+            d.StudyDate = '20180101'
+            d.StudyTime = '120000'
+            d.SeriesInstanceUID = series_uid
+            d.SeriesNumber = series + 1
+            d.SeriesDescription = 'series {}'.format(series)
+            d.ProtocolName = 'protocol {}'.format(series % 3)
+            d.InstanceNumber = image + 1
+            d.ImageType = ['ORIGINAL', 'PRIMARY', 'M', 'ND']
+            d.RepetitionTime = 2000.0
+            d.EchoTime = 30.0
+            d.FlipAngle = 90.0
+            d.SliceThickness = 3.0
+            d.SliceLocation = 3.0 * image
+            d.ImagePositionPatient = [0.0, 0.0, 3.0 * image]
+            d.ImageOrientationPatient = [1.0, 0.0, 0.0, 0.0, 1.0, 0.0]
+            d.PixelSpacing = [2.0, 2.0]
+            d.Rows = rows
+            d.Columns = cols
+            d.SamplesPerPixel = 1
+            d.PhotometricInterpretation = 'MONOCHROME2'
+            d.BitsAllocated = 16
+            d.BitsStored = 12
+            d.HighBit = 11
+            d.PixelRepresentation = 0
+            if n_private_tags:
+                block = d.private_block(0x0019, 'SYNTHETIC', create=True)
+                for i in range(n_private_tags):
+                    block.add_new(i, 'LO', 'value {}'.format(i))
+            d.PixelData = pixels
+            fpath = op.join(
+                'series{:03d}'.format(series), 'im{:05d}.dcm'.format(image))
+            if legacy:
+                d.is_little_endian = True
+                d.is_implicit_VR = False
+                d.save_as(op.join(path, fpath), write_like_original=False)
+            else:
+                d.save_as(op.join(path, fpath), enforce_file_format=True)
+            files.append(fpath)
+    return files
+
+
+def make_nifti_files(path, n_files, compressed=True, ndim=4,
+                     shape=(16, 16, 8, 10)):
+    """Create NIfTI-1 images
+
+    Parameters
+    ----------
+    path : str
+      Target directory.
+    n_files : int
+    compressed : bool
+      Whether to save gzip-compressed images.
+    ndim : {3, 4}
+      Dimensionality of the images, `shape` is truncated accordingly.
+    shape : tuple
+
+    Returns
+    -------
+    list
+    """
+    import nibabel
+    import numpy as np
+
+    ext = '.nii.gz' if compressed else '.nii'
+    # noise, as in real data, does not compress much
+    data = np.random.RandomState(0).randint(
+        0, 1000, shape[:ndim]).astype(np.int16)
+    img = nibabel.Nifti1Image(data, np.diag([2.0, 2.0, 3.0, 1.0]))
+    img.header.set_xyzt_units('mm', 'sec')
+    files = []
+    for i in range(n_files):
+        fpath = 'img{:05d}{}'.format(i, ext)
+        nibabel.save(img, op.join(path, fpath))
+        files.append(fpath)
+    return files
+
+
+# sidecar content of the synthetic BIDS datasets, by suffix
+_bids_sidecars = {
+    'T1w': {
+        'EchoTime': 0.00293,
+        'FlipAngle': 8,
+        'Manufacturer': 'SYNTHETIC',
+        'MagneticFieldStrength': 3,
+        'RepetitionTime': 2.3,
+    },
+    'bold': {
+        'EchoTime': 0.03,
+        'FlipAngle': 90,
+        'Manufacturer': 'SYNTHETIC',
+        'MagneticFieldStrength': 3,
+        'RepetitionTime': 2.0,
+        'SliceTiming': [0.0, 0.5, 1.0, 1.5],
+        'TaskName': 'rest',
+    },
+}
+
+
+def _bids_prefix(subject, session, n_sessions):
+    sub = 'sub-{:05d}'.format(subject)
+    if not n_sessions:
+        return sub, sub
+    ses = 'ses-{:02d}'.format(session)
+    return op.join(sub, ses), '{}_{}'.format(sub, ses)
+
+
+def make_bids_dataset(path, n_subjects, n_sessions=0, n_runs=1,
+                      defacemask=False, images=False):
+    """Create a BIDS dataset
+
+    Each subject (session) has a T1-weighted image, optionally a defacing
+    mask, and `n_runs` runs of a resting state BOLD acquisition. Image parameters are
+    recorded in per-file JSON sidecars, participant properties in
+    participants.tsv.
+
+    Parameters
+    ----------
+    path : str
+      Root directory of the dataset.
+    n_subjects : int
+    n_sessions : int
+      Number of sessions per subject. With zero sessions, there are no
+      session directories.
+    n_runs : int
+    defacemask : bool
+    images : bool
+      Whether to write (tiny) NIfTI images. Otherwise all image files
+      are empty.
+
+    Returns
+    -------
+    list
+    """
+    if images:
+        import nibabel
+        import numpy as np
+        img = nibabel.Nifti1Image(
+            np.zeros((4, 4, 4, 2), dtype=np.int16),
+            np.diag([2.0, 2.0, 3.0, 1.0]))
+        img.header.set_xyzt_units('mm', 'sec')
+    files = []
+
+    def _write(fpath, content):
+        os.makedirs(op.join(path, op.dirname(fpath)), exist_ok=True)
+        if isinstance(content, dict):
+            with open(op.join(path, fpath), 'w') as f:
+                json.dump(content, f)
+        elif content is None:
+            if images:
+                nibabel.save(img, op.join(path, fpath))
+            else:
+                open(op.join(path, fpath), 'w').close()
+        else:
+            with open(op.join(path, fpath), 'w') as f:
+                f.write(content)
+        files.append(fpath)
+
+    _write('dataset_description.json', {
+        'Name': 'synthetic',
+        'BIDSVersion': '1.0.2',
+        'Authors': ['Jane Doe', 'John Doe'],
+        'License': 'PDDL',
+    })
+    _write('README', 'A synthetic dataset for benchmarks\n')
+    _write('participants.tsv', 'participant_id\tage\tsex\thandedness\n' + ''.join(
+        'sub-{:05d}\t{}\t{}\t{}\n'.format(i, 20 + i % 50, 'mf'[i % 2], 'rl'[i % 3 == 0])
+        for i in range(n_subjects)))
+    for i in range(n_subjects):
+        for j in range(max(n_sessions, 1)):
+            dirname, prefix = _bids_prefix(i, j, n_sessions)
+            anat = op.join(dirname, 'anat', prefix)
+            _write(anat + '_T1w.nii.gz', None)
+            _write(anat + '_T1w.json', _bids_sidecars['T1w'])
+            if defacemask:
+                _write(anat + '_defacemask.nii.gz', None)
+            for run in range(n_runs):
+                func = op.join(
+                    dirname, 'func',
+                    '{}_task-rest_run-{}'.format(prefix, run + 1))
+                _write(func + '_bold.nii.gz', None)
+                _write(func + '_bold.json', _bids_sidecars['bold'])
+    return files
+
+
+def make_scidata_metadata(path, n_subjects, n_sessions=0, n_runs=1,
+                          defacemask=False):
+    """Create aggregated metadata records for a BIDS dataset
+
+    The records match what a metadata query reports for a dataset created
+    by `make_bids_dataset` with the bids and nifti1 extractors enabled, in
+    the form expected by `bids2scidata.convert`.
+
+    Parameters
+    ----------
+    path : str
+      Path of the (not necessarily existing) dataset.
+    n_subjects : int
+    n_sessions : int
+    n_runs : int
+    defacemask : bool
+
+    Returns
+    -------
+    tuple
+      Dataset metadata record and list of file metadata records.
+    """
+    subjects = [
+        {'id': '{:05d}'.format(i),
+         'age(years)': str(20 + i % 50),
+         'sex': ('male', 'female')[i % 2],
+         'handedness': 'rl'[i % 3 == 0]}
+        for i in range(n_subjects)]
+    dsmeta = {
+        'path': path,
+        'type': 'dataset',
+        'refcommit': '0' * 40,
+        'metadata': {
+            'bids': {
+                'name': 'synthetic',
+                'author': ['Jane Doe', 'John Doe'],
+                '@context': {
+                    'EchoTime': {
+                        '@id': 'https://example.com/terms/EchoTime',
+                        'unit': 'uo:0000010',
+                        'unit_label': 'second'},
+                    'Manufacturer': {
+                        '@id': 'http://purl.obolibrary.org/obo/OBI_0000050'},
+                    'RepetitionTime': {
+                        '@id': 'https://example.com/terms/RepetitionTime',
+                        'unit': 'uo:0000010',
+                        'unit_label': 'second'},
+                },
+            },
+            'datalad_unique_content_properties': {
+                'bids': {'subject': subjects},
+            },
+        },
+    }
+    filemeta = []
+
+    def _add(fpath, suffix, subject, **props):
+        bidsmeta = dict(_bids_sidecars.get(suffix, {}), **props)
+        bidsmeta.pop('SliceTiming', None)
+        bidsmeta.update(subject={'id': subject['id']}, suffix=suffix)
+        filemeta.append({
+            'path': op.join(path, fpath),
+            'parentds': path,
+            'type': 'file',
+            'metadata': {
+                'bids': bidsmeta,
+                'nifti1': {
+                    'spatial_resolution(mm)': [2.0, 2.0, 3.0],
+                    'temporal_spacing(s)': 2.0,
+                },
+            },
+        })
+
+    for i, subject in enumerate(subjects):
+        for j in range(max(n_sessions, 1)):
+            dirname, prefix = _bids_prefix(i, j, n_sessions)
+            anat = op.join(dirname, 'anat', prefix)
+            _add(anat + '_T1w.nii.gz', 'T1w', subject)
+            if defacemask:
+                _add(anat + '_defacemask.nii.gz', 'defacemask', subject)
+            for run in range(n_runs):
+                func = op.join(
+                    dirname, 'func',
+                    '{}_task-rest_run-{}'.format(prefix, run + 1))
+                _add(func + '_bold.nii.gz', 'bold', subject,
+                     task='rest', run=run + 1)
+    return dsmeta, filemeta
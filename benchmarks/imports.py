@@ -0,0 +1,71 @@
+# emacs: -*- mode: python; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Benchmarks for the time it takes to import the extension
+
+Each import is timed in a fresh interpreter. For a breakdown by module, run
+e.g. ``python -X importtime -c 'import datalad_neuroimaging.bids2scidata'``.
+"""
+
+import subprocess
+import sys
+
+# the modules that any extractor or command builds on, their import time
+# is not attributed to this extension
+BASE_IMPORTS = (
+    'datalad.interface.base',
+    'datalad_deprecated.metadata.extractors.base',
+    'datalad_metalad.extractors.base',
+)
+
+
+def get_import_times(modules):
+    """Import modules in a new interpreter and report `-X importtime` output
+
+    Returns
+    -------
+    dict
+      Self time in microseconds for every module that was imported.
+    """
+    res = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c',
+         'import {}'.format(', '.join(modules))],
+        capture_output=True, text=True, check=True)
+    times = {}
+    for line in res.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        self_time, _, name = line[len('import time:'):].split('|')
+        if self_time.strip().isdigit():
+            times[name.strip()] = int(self_time)
+    return times
+
+
+class Imports:
+    params = [
+        'datalad_neuroimaging',
+        'datalad_neuroimaging.bids2scidata',
+        'datalad_neuroimaging.purge_extractor_cache',
+        'datalad_neuroimaging.extractors.bids',
+        'datalad_neuroimaging.extractors.bids_dataset',
+        'datalad_neuroimaging.extractors.dicom',
+        'datalad_neuroimaging.extractors.nifti1',
+        'datalad_neuroimaging.extractors.nidm',
+    ]
+    param_names = ['module']
+
+    def timeraw_import(self, module):
+        return 'import {}'.format(module)
+
+    def track_import_time_own(self, module):
+        # only what is imported on top of the BASE_IMPORTS
+        base = get_import_times(BASE_IMPORTS)
+        times = get_import_times([module])
+        return sum(t for m, t in times.items() if m not in base) / 1000
+
+    track_import_time_own.unit = 'ms'
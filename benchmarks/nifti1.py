@@ -0,0 +1,93 @@
+# emacs: -*- mode: python; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Benchmarks for the NIfTI-1 metadata extractor"""
+
+import os.path as op
+import tempfile
+from shutil import rmtree
+
+import nibabel
+import numpy as np
+from datalad.api import Dataset
+
+from datalad_neuroimaging.extractors.nifti1 import (
+    MetadataExtractor,
+    _read_header_block,
+)
+
+from .generators import make_nifti_files
+
+
+def _get_bytes_read():
+    """Return the number of bytes read by this process so far (Linux only)"""
+    with open('/proc/self/io') as f:
+        for line in f:
+            if line.startswith('rchar:'):
+                return int(line.split()[1])
+
+
+class HeaderBytesRead:
+    """Amount of data read from disk to obtain the header of a 4D image"""
+    params = ['.nii', '.nii.gz']
+    param_names = ['extension']
+    unit = 'bytes'
+
+    def setup(self, ext):
+        if not op.exists('/proc/self/io'):
+            raise NotImplementedError('no I/O accounting on this platform')
+        self.tmpdir = tempfile.mkdtemp()
+        self.fname = op.join(self.tmpdir, 'bold' + ext)
+        # random data does not compress, like (noisy) real data
+        data = np.random.RandomState(0).randint(
+            0, 1000, (64, 64, 32, 20)).astype(np.int16)
+        nibabel.save(nibabel.Nifti1Image(data, np.eye(4)), self.fname)
+
+    def teardown(self, ext):
+        rmtree(self.tmpdir)
+
+    def _track(self, reader):
+        # account for the reading of /proc/self/io itself
+        start = _get_bytes_read()
+        overhead = _get_bytes_read() - start
+        before = _get_bytes_read()
+        reader(self.fname)
+        return _get_bytes_read() - before - overhead
+
+    def track_nibabel_load(self, ext):
+        return self._track(lambda f: nibabel.load(f).header)
+
+    def track_header_block(self, ext):
+        return self._track(_read_header_block)
+
+    def time_nibabel_load(self, ext):
+        nibabel.load(self.fname).header
+
+    def time_header_block(self, ext):
+        _read_header_block(self.fname)
+
+
+class Metadata:
+    """Metadata extraction from many images"""
+    params = ([100, 1000], [False, True], [3, 4])
+    param_names = ['files', 'compressed', 'ndim']
+    timeout = 600
+
+    def setup(self, n_files, compressed, ndim):
+        self.path = tempfile.mkdtemp()
+        self.files = make_nifti_files(
+            self.path, n_files, compressed=compressed, ndim=ndim)
+        self.extractor = MetadataExtractor(Dataset(self.path), self.files)
+
+    def teardown(self, n_files, compressed, ndim):
+        rmtree(self.path)
+
+    def time_content(self, n_files, compressed, ndim):
+        dsmeta, cnmeta = self.extractor.get_metadata(True, True)
+        for f, md in cnmeta:
+            pass
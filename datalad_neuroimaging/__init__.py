@@ -19,6 +19,12 @@ command_suite = (
             'BIDS2Scidata',
             'bids2scidata',
         ),
+        (
+            'datalad_neuroimaging.purge_extractor_cache',
+            'PurgeExtractorCache',
+            'purge-extractor-cache',
+            'purge_extractor_cache',
+        ),
     ]
 )
 
@@ -15,10 +15,18 @@ import logging
 lgr = logging.getLogger('datalad.neuroimaging.bids2scidata')
 
 from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import csv
+import heapq
 import os
+import pickle
 import re
+import tempfile
 from datetime import datetime
 from io import open
+from itertools import islice
+from itertools import repeat
+from operator import itemgetter
 from os.path import exists
 from os.path import relpath
 from os.path import abspath
@@ -30,14 +38,17 @@ import datalad
 import datalad_neuroimaging
 from datalad import cfg
 from datalad.distribution.dataset import require_dataset
+from datalad.distribution.dataset import resolve_path
 from datalad.interface.base import Interface
 from datalad.interface.base import build_doc
 from datalad.support.param import Parameter
 from datalad.distribution.dataset import datasetmethod
 from datalad.interface.base import eval_results
 from datalad.distribution.dataset import EnsureDataset
+from datalad.support.constraints import EnsureInt
 from datalad.support.constraints import EnsureNone
 from datalad.utils import ensure_list
+from datalad.utils import path_is_subpath
 from datalad_deprecated.metadata.metadata import Metadata
 from urllib.parse import urlsplit
 from urllib.parse import urlunsplit
@@ -47,12 +58,6 @@ from posixpath import split as posixsplit
 # Adapt to metadata code move from datalad-core to datalad-deprecated
 metadata = Metadata.__call__
 
-
-try:
-    import pandas as pd
-except ImportError:
-    pd = None
-
 # regex for a cheap test if something looks like a URL
 r_url = re.compile(r"^https?://")
 
@@ -107,6 +112,9 @@ recognized_assay_props = (
     (("bids", "ReceiveCoilName"), "Parameter Value[coil type]"),
     (("bids", "PulseSequenceType"), "Parameter Value[sequence]"),
     (("bids", "ParallelAcquisitionTechnique"), "Parameter Value[parallel acquisition technique]"),
+    # physiological and stimulus recordings
+    (("bids", "SamplingFrequency"), "Parameter Value[sampling frequency]", "hertz", 'UO:0000106'),
+    (("bids", "StartTime"), "Parameter Value[start time]", "second", 'UO:0000010'),
     ('', "Assay Name"),
     ('', "Raw Data File"),
     (None, "Comment[Data Repository]"),
@@ -149,6 +157,23 @@ protocol_defs = {
         'termsrc': 'OBI'},
 }
 
+# all imaging modalities recognized in BIDS, in the order of their assay
+# tables
+#TODO maybe fold 'defacemask' into each suffix as a derivative
+mri_suffixes = (
+    'defacemask',
+    'T1w', 'T2w', 'T1map', 'T2map', 'FLAIR', 'FLASH', 'PD',
+    'PDmap', 'PDT2', 'inplaneT1', 'inplaneT2', 'angio',
+    'sbref', 'bold', 'SWImagandphase')
+
+# non-MRI modalities, with the label and protocol of their assay tables
+other_assays = (
+    ('physio', 'physio', "Physiological Measurement"),
+    ('stim', 'stimulation', "Stimulation"),
+)
+
+assay_suffixes = frozenset(mri_suffixes + tuple(a[0] for a in other_assays))
+
 
 def getprop(obj, path, default):
     """Helper to get a property from a metadata structure that might not be there"""
@@ -170,7 +195,7 @@ def split_term_source_accession(val):
             return vocab, '{}:{}'.format(vocab, val[len(val_l[0]) + 1:])
         else:
             # no idea
-            lgr.warn("Could not identify term source REF in: '%s'", val)
+            lgr.warning("Could not identify term source REF in: '%s'", val)
             return '', val
     else:
         try:
@@ -180,10 +205,227 @@ def split_term_source_accession(val):
             term_source = urlunsplit((url_s[0], url_s[1], urlpath, url_s[3], url_s[4]))
             return ontology_map.get(term_source, term_source), accession
         except Exception as e:
-            lgr.warn("Could not identify term source REF in: '%s' [%s]", val, exc_str(e))
+            lgr.warning("Could not identify term source REF in: '%s' [%s]", val, exc_str(e))
             return '', val
 
 
+class _TermResolver(object):
+    """Memoizing resolution of term sources and accessions
+
+    Term definitions are split with `split_term_source_accession()`, and
+    properties are looked up in the ``@context`` of the dataset metadata.
+    Results are kept in a size-bounded cache, from which the least
+    recently used ones are evicted first.
+
+    Parameters
+    ----------
+    dsmeta : dict
+      Dataset metadata record.
+    maxsize : int
+      Maximum number of cached results.
+    """
+    def __init__(self, dsmeta, maxsize=1024):
+        self.dsmeta = dsmeta
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+
+    def _get(self, key, func, *args):
+        try:
+            res = self._cache[key]
+        except TypeError:
+            # cannot be cached
+            return func(*args)
+        except KeyError:
+            self.misses += 1
+            res = self._cache[key] = func(*args)
+            if len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+            return res
+        self.hits += 1
+        self._cache.move_to_end(key)
+        return res
+
+    def split(self, val):
+        """Memoized `split_term_source_accession()`"""
+        return self._get(('split', val), split_term_source_accession, val)
+
+    def get_context_term(self, namespace, src):
+        """Look up the definition of a property in the dataset context
+
+        Returns
+        -------
+        tuple
+          Term definition (empty if there is none), term source, and term
+          accession of the property or its unit.
+        """
+        return self._get(
+            ('context', namespace, src), self._get_context_term,
+            namespace, src)
+
+    def _get_context_term(self, namespace, src):
+        # FIXME TODO the next line should look into the local context
+        # of the 'bids' metadata source
+        termdef = getprop(
+            self.dsmeta, ['metadata', namespace, '@context', src], {})
+        term_source, term_accession = self.split(
+            termdef.get('unit' if 'unit' in termdef else '@id', None))
+        return termdef, term_source, term_accession
+
+
+def _get_assay_metadata_props():
+    # BIDS properties used for any file
+    props = {'bids': {
+        'suffix', 'subject', 'rec', 'recording', 'acq', 'acquisition',
+        'task'}}
+    for prop in recognized_assay_props:
+        if not prop[0]:
+            continue
+        namespace, src = prop[0]
+        props.setdefault(namespace, set()).add(src)
+        if len(prop) == 3:
+            # term definition outside any namespace, taken as is
+            props[prop[2]] = None
+    return props
+
+
+# metadata properties of files that are reported in assay tables,
+# by namespace
+assay_metadata_props = _get_assay_metadata_props()
+
+
+def _prune_file_record(fmeta):
+    """Return a copy of a file record with only what assay tables report"""
+    meta = fmeta.get('metadata', {})
+    pruned = {}
+    for key, props in assay_metadata_props.items():
+        if key not in meta:
+            continue
+        val = meta[key]
+        if props is not None and isinstance(val, dict):
+            val = {k: val[k] for k in props if k in val}
+        pruned[key] = val
+    subject = pruned.get('bids', {}).get('subject', None)
+    if isinstance(subject, dict):
+        # the record might come with all properties of a participant
+        pruned['bids']['subject'] = {
+            k: subject[k] for k in ('id',) if k in subject}
+    rec = {k: fmeta[k] for k in ('path', 'parentds') if k in fmeta}
+    rec['metadata'] = pruned
+    return rec
+
+
+def _add_to_index(index, fmeta):
+    """Add a file record to a suffix index, see `_index_by_suffix()`"""
+    suffix = getprop(fmeta, ['metadata', 'bids', 'suffix'], None)
+    if suffix not in assay_suffixes:
+        return
+    fmeta = _prune_file_record(fmeta)
+    files = index.get(suffix)
+    if files is None:
+        index[suffix] = [fmeta]
+    else:
+        files.append(fmeta)
+
+
+def _index_by_suffix(filemeta):
+    """Group file metadata records by their BIDS suffix
+
+    Only records of modalities with assay tables are included, and only
+    with the properties reported in them.
+
+    Returns
+    -------
+    dict
+      Mapping of suffixes to lists of records, in the order of `filemeta`.
+    """
+    index = {}
+    for f in filemeta:
+        _add_to_index(index, f)
+    return index
+
+
+def _query_dataset_metadata(path, dataset):
+    """Query the metadata of a single dataset, in a worker process
+
+    Returns
+    -------
+    list
+      Result records, with file records pruned by `_prune_file_record()`.
+    """
+    res = []
+    for m in metadata(
+            path,
+            dataset=dataset,
+            recursive=False,
+            reporton='all',
+            return_type='generator',
+            result_renderer='disabled'):
+        if m.get('type', None) == 'file' and m.get('status', None) == 'ok':
+            # keep what is sent back to the main process small
+            m = dict(m, **_prune_file_record(m))
+        res.append(m)
+    return res
+
+
+def _iter_metadata(path, dataset, jobs=None):
+    """Query the metadata of all datasets underneath a path
+
+    Without `jobs`, this is a single recursive query. Otherwise, each
+    dataset with aggregated metadata underneath the query path is queried
+    separately by a pool of `jobs` processes. Results are reported in the
+    order of a recursive query.
+
+    Parameters
+    ----------
+    path : str or None
+    dataset : Dataset
+    jobs : int, optional
+
+    Yields
+    ------
+    dict
+      Result records of the metadata query.
+    """
+    recursive = not jobs or jobs < 2
+    query = metadata(
+        path,
+        dataset=dataset,
+        # BIDS hierarchy might go across multiple dataset
+        recursive=recursive,
+        reporton='all',
+        return_type='generator',
+        result_renderer='disabled')
+    yield from query
+    if recursive:
+        return
+    # so far only the query path itself, which need not be a dataset,
+    # now all datasets underneath it
+    root = dataset.path if path is None else str(resolve_path(path, dataset))
+    subdatasets = []
+    for m in metadata(
+            dataset=dataset,
+            get_aggregates=True,
+            return_type='generator',
+            result_renderer='disabled'):
+        if m.get('status', None) != 'ok':
+            yield m
+        elif path_is_subpath(m['path'], root):
+            subdatasets.append(m['path'])
+    if not subdatasets:
+        return
+    lgr.debug('Querying metadata of %i datasets with %i processes',
+              len(subdatasets), jobs)
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        # aggregates are reported in the order a recursive query visits them
+        for res in executor.map(
+                _query_dataset_metadata,
+                subdatasets,
+                repeat(dataset.path)):
+            yield from res
+
+
 def _get_study_df(dsmeta):
     # TODO use helper
     participants = getprop(
@@ -211,6 +453,7 @@ def _get_study_df(dsmeta):
         "Protocol REF",
         "Sample Name"
     ]
+    import pandas as pd
     df = pd.DataFrame(
         sample_info,
         columns=column_order + sorted(c for c in columns_addon if c not in column_order))
@@ -219,70 +462,117 @@ def _get_study_df(dsmeta):
     return df
 
 
-def _describe_file(dsmeta, fmeta):
-    meta = getprop(fmeta, ['metadata'], {})
-    bidsmeta = getprop(meta, ['bids'], {})
-    suffix = getprop(bidsmeta, ['suffix'], None)
-    if suffix is None:
+def _describe_files(dsmeta, files, resolver=None):
+    """Describe files in ISATAB notation, one column at a time
+
+    Term sources are determined once per column, unless they are
+    specified in the metadata of each file.
+
+    Parameters
+    ----------
+    dsmeta : dict
+    files : list
+    resolver : _TermResolver, optional
+      To reuse resolved term sources across calls.
+
+    Returns
+    -------
+    dict
+      Mapping of column names to lists of values, one for each file, None
+      for files that have no value. Unit and term source information for
+      a column is reported under the column name with a '_unit_label',
+      '_term_source', and '_term_accession' suffix.
+    """
+    if resolver is None:
+        resolver = _TermResolver(dsmeta)
+    nfiles = len(files)
+    metas = [getprop(fmeta, ['metadata'], {}) for fmeta in files]
+    bidsmetas = [getprop(meta, ['bids'], {}) for meta in metas]
+    suffixes = [getprop(bidsmeta, ['suffix'], None) for bidsmeta in bidsmetas]
+    if None in suffixes:
         raise ValueError('file record has no type info, not sure what this is')
     info = {
-        'Sample Name': getprop(bidsmeta, ['subject', 'id'], None),
+        'Sample Name': [
+            getprop(bidsmeta, ['subject', 'id'], None)
+            for bidsmeta in bidsmetas],
         # assay name is the entire filename except for the modality suffix
         # so that, e.g. simultaneous recordings match wrt to the assay name
         # across assay tables
-        'Assay Name': psplit(fmeta['path'])[-1].split('.')[0][:-(len(suffix) + 1)],
-        'Raw Data File': relpath(fmeta['path'], start=fmeta['parentds']),
-        'Parameter Value[modality]': suffix,
+        'Assay Name': [
+            psplit(fmeta['path'])[-1].split('.')[0][:-(len(suffix) + 1)]
+            for fmeta, suffix in zip(files, suffixes)],
+        'Raw Data File': [
+            relpath(fmeta['path'], start=fmeta['parentds'])
+            for fmeta in files],
+        'Parameter Value[modality]': suffixes,
     }
-    for l in ('rec', 'recording'):
-        if l in bidsmeta:
-            info['Parameter Value[recording label]'] = bidsmeta[l]
-    for l in ('acq', 'acquisition'):
-        if l in bidsmeta:
-            info['Parameter Value[acquisition label]'] = bidsmeta[l]
-    if 'task' in bidsmeta:
-        info['Factor Value[task]'] = bidsmeta['task']
+
+    def _set_column(column, rows, values):
+        col = info.get(column)
+        if col is None:
+            col = info[column] = [None] * nfiles
+        for row, val in zip(rows, values):
+            col[row] = val
+
+    for column, labels in (
+            ('Parameter Value[recording label]', ('rec', 'recording')),
+            ('Parameter Value[acquisition label]', ('acq', 'acquisition')),
+            ('Factor Value[task]', ('task',))):
+        for l in labels:
+            rows = [i for i, bidsmeta in enumerate(bidsmetas) if l in bidsmeta]
+            if rows:
+                _set_column(column, rows, [bidsmetas[i][l] for i in rows])
 
     # now pull in the value of all recognized properties
     # perform any necessary conversion to achieve final
     # form for ISATAB table
     for prop in recognized_assay_props:
         src, dst = prop[:2]
-        # expand src specfification
-        namespace, src = src if src else (None, src)
-        if src is None:
+        if not src:
             # special case, not handled here
             continue
-        if src in meta.get(namespace, {}):
-            # pull out the value from datalad metadata directly,
-            # unless we have a definition URL in another field,
-            # in which case put it into a 2-tuple also
-            val = meta[namespace][src]
-            if dst in repr_props and isinstance(val, (list, tuple)):
-                val = repr_props[dst](str(i) for i in val)
-            info[dst] = val
-            if len(prop) == 4:
-                # we have a unit definition
-                info['{}_unit_label'.format(dst)] = prop[2]
-            term_source = term_accession = None
-            if len(prop) > 2:
-                term_source, term_accession = split_term_source_accession(
-                    meta.get(prop[2], None) if len(prop) == 3 else prop[3])
-            elif prop[0] and prop[1] != 'Sample Name':
-                # exclude all info source outside the metadata
-                # this plugin has no vocabulary info for this field
-                # we need to look into the dataset context to see if we know
-                # anything
-                # FIXME TODO the next line should look into the local context
-                # of the 'bids' metadata source
-                termdef = getprop(dsmeta, ['metadata', namespace, '@context', src], {})
-                term_source, term_accession = split_term_source_accession(
-                    termdef.get('unit' if 'unit' in termdef else '@id', None))
-                if 'unit_label' in termdef:
-                    info['{}_unit_label'.format(dst)] = termdef['unit_label']
-            if term_accession is not None:
-                info['{}_term_source'.format(dst)] = term_source
-                info['{}_term_accession'.format(dst)] = term_accession
+        namespace, src = src
+        # files that have a value for this property
+        rows = [i for i, meta in enumerate(metas)
+                if src in meta.get(namespace, {})]
+        if not rows:
+            continue
+        # pull out the value from datalad metadata directly,
+        # unless we have a definition URL in another field,
+        # in which case put it into a 2-tuple also
+        values = [metas[i][namespace][src] for i in rows]
+        if dst in repr_props:
+            values = [
+                repr_props[dst](str(i) for i in val)
+                if isinstance(val, (list, tuple)) else val
+                for val in values]
+        _set_column(dst, rows, values)
+        if len(prop) == 4:
+            # we have a unit definition
+            _set_column('{}_unit_label'.format(dst), rows, [prop[2]] * len(rows))
+        terms = None
+        if len(prop) == 3:
+            # the term definition is in the metadata of each file
+            terms = [resolver.split(metas[i].get(prop[2], None)) for i in rows]
+        elif len(prop) == 4:
+            terms = [resolver.split(prop[3])] * len(rows)
+        elif dst != 'Sample Name':
+            # exclude all info source outside the metadata
+            # this plugin has no vocabulary info for this field
+            # we need to look into the dataset context to see if we know
+            # anything
+            termdef, term_source, term_accession = resolver.get_context_term(
+                namespace, src)
+            terms = [(term_source, term_accession)] * len(rows)
+            if 'unit_label' in termdef:
+                _set_column(
+                    '{}_unit_label'.format(dst), rows,
+                    [termdef['unit_label']] * len(rows))
+        if terms is not None:
+            _set_column(
+                '{}_term_source'.format(dst), rows, [t[0] for t in terms])
+            _set_column(
+                '{}_term_accession'.format(dst), rows, [t[1] for t in terms])
 
     return info
 
@@ -291,39 +581,34 @@ def _get_colkey(idx, colname):
     return '{0:0>5}_{1}'.format(idx, colname)
 
 
-def _get_assay_df(
-        dsmeta,
-        modality, protocol_ref, files, file_descr,
-        repository_info=None):
-    if not repository_info:
-        repository_info = {}
-    # main assays
+def _get_assay_columns(columns, nonempty, protocol_ref, repository_info):
+    """Determine the columns of an assay table, and their order
+
+    Parameters
+    ----------
+    columns : container
+      Names of all columns reported by `_describe_files()`.
+    nonempty : container
+      Names of columns with at least one value.
+    protocol_ref : str
+    repository_info : dict
+
+    Returns
+    -------
+    list
+      (column key, column name, value) tuples. The column name is None
+      for columns with the same value in all rows. The key of the assay
+      name column has the name 'Assay Name'.
+    """
     # we cannot use a dict to collect the data before going to
     # a data frame, because we will have multiple columns with
     # the same name carrying the ontology info for preceding
     # columns
     # --> prefix with some index, create dataframe and rename
     # the column names in the dataframe with the prefix stripped
-    assay_dict = {}
-    # get all files described and determine the union of all keys
-    finfos = []
-    info_keys = set()
-    for finfo in files:
-        # get file metadata in ISATAB notation
-        finfo = file_descr(dsmeta, finfo)
-        info_keys = info_keys.union(finfo.keys())
-        finfos.append(finfo)
-    # receiver for data in all columns of the table
-    collector_dict = dict(zip(info_keys, [[] for i in range(len(info_keys))]))
-    # expand data with missing values across all files/rows
-    for finfo in finfos:
-        for spec in info_keys:
-            fspec = finfo.get(spec, None)
-            collector_dict[spec].append(fspec)
-    # build the table order
+    assay_columns = []
     idx = 1
     idx_map = {}
-    assay_name_key = None
     for prop in recognized_assay_props:
         colname = prop[1]
         if colname in idx_map:
@@ -333,43 +618,71 @@ def _get_assay_df(
         if prop[0] is None:
             # special case handling
             if colname == 'Protocol REF':
-                assay_dict[_get_colkey(idx, colname)] = protocol_ref
+                assay_columns.append(
+                    (_get_colkey(idx, colname), None, protocol_ref))
                 idx += 1
             elif colname in repository_info:
-                assay_dict[_get_colkey(idx, colname)] = repository_info[colname]
+                assay_columns.append(
+                    (_get_colkey(idx, colname), None, repository_info[colname]))
                 idx += 1
             continue
 
-        elif colname not in collector_dict:
+        elif colname not in columns:
             # we got nothing for this column
             continue
         # skip empty
-        if not all([v is None for v in collector_dict[colname]]):
+        if colname in nonempty:
             # be able to look up the actual column key in case
             # prev information needs to be replaced by a value from
             # a better source (as determined by the order)
             colkey = idx_map.get(colname, _get_colkey(idx, colname))
             idx_map[colname] = colkey
-            assay_dict[colkey] = collector_dict[colname]
+            assay_columns.append((colkey, colname, None))
             idx += 1
-            if colname == 'Assay Name':
-                assay_name_key = colkey
             for aux_info, aux_colname in (
                     ('unit_label', 'Unit'),
                     ('term_source', 'Term Source REF'),
                     ('term_accession', 'Term Accession Number')):
                 aux_source = '{}_{}'.format(colname, aux_info)
-                if aux_source not in collector_dict:
+                if aux_source not in columns:
                     # we got nothing on this from any file
                     continue
-                assay_dict[_get_colkey(idx, aux_colname)] = collector_dict[aux_source]
+                assay_columns.append(
+                    (_get_colkey(idx, aux_colname), aux_source, None))
                 idx += 1
+    return assay_columns
+
+
+def _get_assay_df(
+        dsmeta,
+        modality, protocol_ref, files, file_descr,
+        repository_info=None, resolver=None):
+    if not repository_info:
+        repository_info = {}
+    # main assays
+    # get file metadata in ISATAB notation, with data in all columns of
+    # the table, and missing values across all files/rows
+    collector_dict = file_descr(dsmeta, files, resolver)
+    # build the table order
+    assay_columns = _get_assay_columns(
+        collector_dict,
+        [c for c, v in collector_dict.items()
+         if not all([i is None for i in v])],
+        protocol_ref,
+        repository_info)
+    assay_name_key = None
+    assay_dict = {}
+    for colkey, colname, value in assay_columns:
+        assay_dict[colkey] = value if colname is None else collector_dict[colname]
+        if colname == 'Assay Name':
+            assay_name_key = colkey
 
     if assay_name_key is None:
         # we didn't get a single meaningful file
         return None
 
     # TODO use assay name as index! for join with deface later on
+    import pandas as pd
     df = pd.DataFrame(assay_dict, index=assay_dict[assay_name_key])
     return df
 
@@ -385,35 +698,380 @@ def _store_beautiful_table(df, output_directory, fname):
         index=False)
 
 
-def _gather_protocol_parameters_from_df(df, protocols):
+def _get_value_kind(val):
+    """Categorize a value like pandas does when inferring column types"""
+    if isinstance(val, bool):
+        return 'bool'
+    elif isinstance(val, int):
+        return 'int'
+    elif isinstance(val, float):
+        return 'float'
+    return 'object'
+
+
+def _get_value_formatter(kinds, missing):
+    """Return a function to format the values of a column like `to_csv()`
+
+    Parameters
+    ----------
+    kinds : set
+      Kinds of all values in the column, see `_get_value_kind()`.
+    missing : bool
+      Whether any row has no value in the column.
+    """
+    if kinds == {'int'} and not missing:
+        return str
+    elif kinds and kinds <= {'int', 'float'}:
+        # pandas makes this a float column, with NaN for missing values
+        return lambda v: '' if v is None else repr(float(v))
+    return lambda v: '' if v is None else str(v)
+
+
+def _iter_chunks(iterable, size):
+    it = iter(iterable)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _iter_run(path):
+    with open(path, 'rb') as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+
+def _stream_assay_table(
+        dsmeta, modality, protocol_ref, files, repository_info, deface_df,
+        output_directory, fname, chunk_size, resolver=None):
+    """Store an assay table without holding all of its rows in memory
+
+    This produces the same table as `_get_assay_df()`, followed by a join
+    with the defacing masks and `_store_beautiful_table()`. Files are
+    described `chunk_size` at a time. The rows of each chunk are sorted by
+    assay name and spilled to a temporary file, and all sorted runs are
+    merged into the final table. Across all rows, only the presence and
+    the types of values are tracked for each column, in order to format
+    values like pandas would.
+
+    Returns
+    -------
+    tuple or None
+      Column names of the table, and for each column the protocols
+      referenced in it. None, if there was nothing to report.
+    """
+    if not repository_info:
+        repository_info = {}
+    if resolver is None:
+        # share resolved terms across all chunks
+        resolver = _TermResolver(dsmeta)
+    deface_columns = []
+    deface_rows = {}
+    if deface_df is not None:
+        deface_columns = [c[6:] for c in deface_df.columns]
+        for assay_name, *values in zip(
+                deface_df.index,
+                *(deface_df.iloc[:, i].tolist()
+                  for i in range(len(deface_columns)))):
+            deface_rows.setdefault(
+                assay_name,
+                [None if isinstance(v, float) and v != v else v
+                 for v in values])
+        # [kinds, number of values], object columns stay what they are
+        deface_stats = [
+            [{'object'} if dtype == object else set(), 0]
+            for dtype in deface_df.dtypes]
+        deface_protocols = [[] for c in deface_columns]
+    # column name -> [kinds, number of values]
+    column_stats = {}
+    nrows = 0
+    nmatched = 0
+    runs = []
+    with tempfile.TemporaryDirectory(dir=output_directory) as tmpdir:
+        for chunk in _iter_chunks(files, chunk_size):
+            info = _describe_files(dsmeta, chunk, resolver)
+            for column, values in info.items():
+                stats = column_stats.setdefault(column, [set(), 0])
+                for v in values:
+                    if v is not None:
+                        stats[0].add(_get_value_kind(v))
+                        stats[1] += 1
+            rows = []
+            for i, assay_name in enumerate(info['Assay Name']):
+                deface = deface_rows.get(assay_name)
+                if deface is not None:
+                    nmatched += 1
+                    for j, v in enumerate(deface):
+                        if v is None:
+                            continue
+                        deface_stats[j][0].add(_get_value_kind(v))
+                        deface_stats[j][1] += 1
+                        if deface_columns[j] == 'Protocol REF' \
+                                and v not in deface_protocols[j]:
+                            deface_protocols[j].append(v)
+                rows.append((
+                    assay_name,
+                    {column: values[i] for column, values in info.items()
+                     if values[i] is not None},
+                    deface))
+            nrows += len(rows)
+            rows.sort(key=itemgetter(0))
+            run = opj(tmpdir, 'run{}'.format(len(runs)))
+            with open(run, 'wb') as f:
+                for row in rows:
+                    pickle.dump(row, f, pickle.HIGHEST_PROTOCOL)
+            runs.append(run)
+
+        assay_columns = _get_assay_columns(
+            column_stats,
+            [c for c, stats in column_stats.items() if stats[1]],
+            protocol_ref,
+            repository_info)
+        if not any(colname == 'Assay Name'
+                   for _, colname, _ in assay_columns):
+            # we didn't get a single meaningful file
+            return None
+        # (column name, source, key, formatter, referenced protocols)
+        # with the source being 'value' for a value that is the same in
+        # all rows, 'file' for a property of a file, and 'deface' for a
+        # property of its defacing mask
+        cells = []
+        for colkey, colname, value in assay_columns:
+            if colname is None:
+                cells.append((
+                    colkey[6:], 'value', value,
+                    _get_value_formatter({_get_value_kind(value)}, False),
+                    [value]))
+            else:
+                kinds, nvalues = column_stats[colname]
+                cells.append((
+                    colkey[6:], 'file', colname,
+                    _get_value_formatter(kinds, nvalues < nrows),
+                    None))
+        # only join the defacing masks with a table that has images they
+        # were derived from
+        if nmatched:
+            # get any factor columns, put last in final table
+            first_factor = len(cells)
+            for i, c in enumerate(cells):
+                if c[0].startswith('Factor Value['):
+                    first_factor = i
+                    break
+            factors = cells[first_factor:]
+            cells = cells[:first_factor] + [
+                (colname, 'deface', i,
+                 _get_value_formatter(kinds, nvalues < nrows),
+                 protocols)
+                for i, (colname, (kinds, nvalues), protocols) in enumerate(
+                    zip(deface_columns, deface_stats, deface_protocols))
+            ] + factors
+
+        with open(opj(output_directory, fname), 'w', newline='',
+                  encoding='utf-8') as f:
+            writer = csv.writer(f, delimiter='\t', lineterminator=os.linesep)
+            writer.writerow([c[0] for c in cells])
+            for _, values, deface in heapq.merge(
+                    *(_iter_run(r) for r in runs), key=itemgetter(0)):
+                row = []
+                for _, source, key, fmt, _ in cells:
+                    if source == 'file':
+                        row.append(fmt(values.get(key)))
+                    elif source == 'deface':
+                        row.append(fmt(deface[key] if deface else None))
+                    else:
+                        row.append(fmt(key))
+                writer.writerow(row)
+    return (
+        [c[0] for c in cells],
+        [c[4] if c[0] == 'Protocol REF' else None for c in cells])
+
+
+def _get_deface_df(dsmeta, files, repository_info, resolver=None):
+    """Build the table of defacing masks to join with other MRI assays
+
+    Returns
+    -------
+    DataFrame or None
+      Indexed by assay name, with the index-prefixed column names of
+      `_get_assay_df()`.
+    """
+    if not files:
+        return None
+    df = _get_assay_df(
+        dsmeta,
+        'defacemask',
+        "Magnetic Resonance Imaging",
+        files,
+        _describe_files,
+        repository_info,
+        resolver)
+    if df is None:
+        return None
+    # rename columns to strip index
+    df.columns = [c[6:] for c in df.columns]
+    df.rename(columns={'Raw Data File': 'Derived Data File'}, inplace=True)
+    df.drop(
+        ['Assay Name', 'Sample Name'] +
+        [c for c in df.columns if c.startswith('Factor')],
+        axis=1,
+        inplace=True)
+    # re-prefix for merge logic compatibility below
+    df.columns = [_get_colkey(i, c) for i, c in enumerate(df.columns)]
+    return df
+
+
+def _store_mri_assay_table(
+        dsmeta, suffix, files, repository_info, deface_df,
+        output_directory, chunk_size=None, resolver=None):
+    """Build and store the assay table for the files of an MRI suffix
+
+    This is done in a worker process, when assay tables are generated in
+    parallel.
+
+    Returns
+    -------
+    tuple or None
+      File name of the table, and the protocols of the table with their
+      parameters. None, if there was nothing to report.
+    """
+    assay_fname = "a_mri_{}.txt".format(suffix.lower())
+    protocols = OrderedDict()
+    if chunk_size:
+        res = _stream_assay_table(
+            dsmeta,
+            suffix,
+            "Magnetic Resonance Imaging",
+            files,
+            repository_info,
+            deface_df,
+            output_directory,
+            assay_fname,
+            chunk_size,
+            resolver)
+        if res is None:
+            return None
+        _gather_protocol_parameters(res[0], res[1], protocols)
+        return assay_fname, protocols
+    df = _get_assay_df(
+        dsmeta,
+        suffix,
+        "Magnetic Resonance Imaging",
+        files,
+        _describe_files,
+        repository_info,
+        resolver)
+    if df is None:
+        return None
+    # only join the defacing masks with a table that has images they
+    # were derived from
+    if deface_df is not None and df.index.isin(deface_df.index).any():
+        # get any factor columns, put last in final table
+        factors = []
+        # find where they stat
+        for i, c in enumerate(df.columns):
+            if '_Factor Value[' in c:
+                factors = df.columns[i:]
+                break
+        factor_df = df[factors]
+        df.drop(factors, axis=1, inplace=True)
+        # merge relevant rows from deface df (hstack), by matching assay name
+        df = df.join(deface_df, rsuffix='_deface')
+        df.columns = [c[:-7] if c.endswith('_deface') else c for c in df.columns]
+        # cannot have overlapping columns, we removed the factor before
+        df = df.join(factor_df)
+    # rename columns to strip index
+    df.columns = [c[6:] for c in df.columns]
+    # parse df to gather protocol info
+    _gather_protocol_parameters_from_df(df, protocols)
+    # store
+    _store_beautiful_table(
+        df,
+        output_directory,
+        assay_fname)
+    return assay_fname, protocols
+
+
+def _gather_protocol_parameters(columns, protocol_refs, protocols):
+    """Record the parameters of the protocols referenced in an assay table
+
+    Parameters
+    ----------
+    columns : list
+      Column names of the table.
+    protocol_refs : list
+      For each column, the protocols referenced in it.
+    protocols : dict
+      Protocol names are mapped to sets of parameter names in here.
+    """
     params = set()
     protos = None
-    for i, col in enumerate(list(df.columns) + ['Protocol REF']):
+    for i, col in enumerate(list(columns) + ['Protocol REF']):
         if col == 'Protocol REF':
             if protos is not None:
                 # we had some before, store
                 for p in protos:
                     pdef = protocols.get(p, set()).union(params)
                     protocols[p] = pdef
-                if i > len(df.columns) - 1:
+                if i > len(columns) - 1:
                     break
             # this is a protocol definition column,
             # make entry for each unique value
-            protos = df.iloc[:, i].unique()
+            protos = protocol_refs[i]
         if col.startswith('Parameter Value['):
             params.add(col[16:-1])
 
 
+def _gather_protocol_parameters_from_df(df, protocols):
+    _gather_protocol_parameters(
+        df.columns,
+        # rows of a joined table might have no protocol
+        [df.iloc[:, i].dropna().unique() if c == 'Protocol REF' else None
+         for i, c in enumerate(df.columns)],
+        protocols)
+
+
 def convert(
         dsmeta,
         filemeta,
         output_directory,
-        repository_info=None):
-    if pd is None:
+        repository_info=None,
+        jobs=None,
+        chunk_size=None):
+    """Generate ISA-Tab study and assay tables from metadata records
+
+    Parameters
+    ----------
+    dsmeta : dict
+      Dataset metadata record.
+    filemeta : iterable or dict
+      File metadata records, or a mapping of suffixes to records as built
+      by `_index_by_suffix()`.
+    output_directory : str
+    repository_info : dict, optional
+      Values of the repository comment columns of assay tables.
+    jobs : int, optional
+      Number of processes to generate assay tables with.
+    chunk_size : int, optional
+      If given, assay tables are written in chunks of this many files,
+      see `_stream_assay_table()`.
+
+    Returns
+    -------
+    dict or None
+      Values to fill the investigation template with. None, if there is
+      no participant information.
+    """
+    # only imported when needed, it takes a while
+    try:
+        import pandas
+    except ImportError:
         lgr.error(
             "This plugin requires Pandas to be available (error follows)")
-        import pandas
-        return
+        raise
 
     # collect infos about dataset and ISATAB structure for use in investigator
     # template
@@ -447,70 +1105,40 @@ def convert(
         "s_study.txt")
     info['studytab_filename'] = 's_study.txt'
 
-    deface_df = None
-    # all imaging modalities recognized in BIDS
-    #TODO maybe fold 'defacemask' into each suffix as a derivative
-    for suffix in ('defacemask',
-                     'T1w', 'T2w', 'T1map', 'T2map', 'FLAIR', 'FLASH', 'PD',
-                     'PDmap', 'PDT2', 'inplaneT1', 'inplaneT2', 'angio',
-                     'sbref', 'bold', 'SWImagandphase'):
-        # what files do we have for this type
-        modfiles = [f for f in filemeta
-                    if getprop(f, ['metadata', 'bids', 'suffix'], None) == suffix]
-        if not len(modfiles):
-            # not files found, try next
+    # what files do we have for each type
+    suffix_index = filemeta if isinstance(filemeta, dict) \
+        else _index_by_suffix(filemeta)
+    mrifiles = OrderedDict(
+        (suffix, suffix_index.get(suffix, [])) for suffix in mri_suffixes)
+    for suffix in mri_suffixes:
+        if not mrifiles[suffix]:
+            # not files found
             lgr.info(
                 "no files match MRI suffix '{}', skipping".format(suffix))
-            continue
 
-        df = _get_assay_df(
-            dsmeta,
-            suffix,
-            "Magnetic Resonance Imaging",
-            modfiles,
-            _describe_file,
-            repository_info)
-        if df is None:
-            continue
-        if suffix == 'defacemask':
-            # rename columns to strip index
-            df.columns = [c[6:] for c in df.columns]
-            df.rename(columns={'Raw Data File': 'Derived Data File'}, inplace=True)
-            df.drop(
-                ['Assay Name', 'Sample Name'] +
-                [c for c in df.columns if c.startswith('Factor')],
-                axis=1,
-                inplace=True)
-            deface_df = df
-            # re-prefix for merge logic compatibility below
-            deface_df.columns = [_get_colkey(i, c) for i, c in enumerate(df.columns)]
-            # do not save separate, but include into the others as a derivative
+    # term sources are the same for many files, across all tables
+    resolver = _TermResolver(dsmeta)
+    # do not save separate, but include into the others as a derivative
+    deface_df = _get_deface_df(
+        dsmeta, mrifiles.pop('defacemask'), repository_info, resolver)
+    tables = [
+        (dsmeta, suffix, modfiles, repository_info, deface_df,
+         output_directory, chunk_size, resolver)
+        for suffix, modfiles in mrifiles.items() if modfiles]
+    if jobs and jobs > 1 and len(tables) > 1:
+        lgr.debug('Generating %i assay tables with %i processes',
+                  len(tables), jobs)
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = list(executor.map(_store_mri_assay_table, *zip(*tables)))
+    else:
+        results = [_store_mri_assay_table(*t) for t in tables]
+    for res in results:
+        if res is None:
             continue
-        elif deface_df is not None:
-            # get any factor columns, put last in final table
-            factors = []
-            # find where they stat
-            for i, c in enumerate(df.columns):
-                if '_Factor Value[' in c:
-                    factors = df.columns[i:]
-                    break
-            factor_df = df[factors]
-            df.drop(factors, axis=1, inplace=True)
-            # merge relevant rows from deface df (hstack), by matching assay name
-            df = df.join(deface_df, rsuffix='_deface')
-            df.columns = [c[:-7] if c.endswith('_deface') else c for c in df.columns]
-            # cannot have overlapping columns, we removed the factor before
-            df = df.join(factor_df)
-        # rename columns to strip index
-        df.columns = [c[6:] for c in df.columns]
-        # parse df to gather protocol info
-        _gather_protocol_parameters_from_df(df, protocols)
-        # store
-        assay_fname = "a_mri_{}.txt".format(suffix.lower())
-        _store_beautiful_table(
-            df,
-            output_directory,
-            assay_fname)
+        assay_fname, assay_protocols = res
+        # same order of protocols as if gathered one table after another
+        for p, params in assay_protocols.items():
+            protocols[p] = protocols.get(p, set()).union(params)
         info['assay_fname'].append(assay_fname)
         info['assay_techtype'].append('nuclear magnetic resonance')
         info['assay_techtype_term'].append('OBI:0000182')
@@ -520,26 +1148,41 @@ def convert(
         info['assay_measurementtype_termsrc'].append('ERO')
 
     # non-MRI modalities
-    for modlabel, assaylabel, protoref in (
-            ('physio', 'physio', "Physiological Measurement"),
-            ('stim', 'stimulation', "Stimulation")):
-        df = _get_assay_df(
-            dsmeta,
-            modlabel,
-            protoref,
-            [f for f in filemeta
-             if getprop(f, ['metadata', 'bids', 'suffix'], None) == suffix],
-            _describe_file,
-            repository_info)
-        if df is None:
+    for modlabel, assaylabel, protoref in other_assays:
+        modfiles = suffix_index.get(modlabel)
+        if not modfiles:
             continue
-        # rename columns to strip index
-        df.columns = [c[6:] for c in df.columns]
         assay_fname = "a_{}.txt".format(assaylabel)
-        _store_beautiful_table(
-            df,
-            output_directory,
-            assay_fname)
+        if chunk_size:
+            if _stream_assay_table(
+                    dsmeta,
+                    modlabel,
+                    protoref,
+                    modfiles,
+                    repository_info,
+                    None,
+                    output_directory,
+                    assay_fname,
+                    chunk_size,
+                    resolver) is None:
+                continue
+        else:
+            df = _get_assay_df(
+                dsmeta,
+                modlabel,
+                protoref,
+                modfiles,
+                _describe_files,
+                repository_info,
+                resolver)
+            if df is None:
+                continue
+            # rename columns to strip index
+            df.columns = [c[6:] for c in df.columns]
+            _store_beautiful_table(
+                df,
+                output_directory,
+                assay_fname)
         info['assay_fname'].append(assay_fname)
         # ATM we cannot say anything definitive about these
         info['assay_techtype'].append('TODO')
@@ -548,6 +1191,9 @@ def convert(
         info['assay_measurementtype'].append(assaylabel)
         info['assay_measurementtype_term'].append('TODO')
         info['assay_measurementtype_termsrc'].append('TODO')
+    # tables generated by worker processes are not accounted for
+    lgr.debug('Resolved term sources (cache hits: %i, misses: %i)',
+              resolver.hits, resolver.misses)
 
     # post-proc assay-props for output
     for prop in assay_props:
@@ -593,13 +1239,27 @@ class BIDS2Scidata(Interface):
             Example: https://openfmri.org/dataset/ds000113d"""),
         output=Parameter(
             args=('--output',),
-            doc="""directory where ISA-TAB files will be stored""",)
+            doc="""directory where ISA-TAB files will be stored""",),
+        jobs=Parameter(
+            args=('-J', '--jobs'),
+            doc="""number of processes to use for querying the metadata of
+            subdatasets, and for generating assay tables of different MRI
+            modalities in parallel""",
+            constraints=EnsureInt() | EnsureNone()),
+        chunk_size=Parameter(
+            args=('--chunk-size',),
+            doc="""if given, assay tables are written without holding all
+            of their rows in memory. Files are processed in chunks of this
+            size, and the rows of each chunk are sorted in a temporary
+            file in the output directory.""",
+            constraints=EnsureInt() | EnsureNone()),
     )
 
     @staticmethod
     @datasetmethod(name='bids2scidata')
     @eval_results
-    def __call__(repo_name, repo_accession, repo_url, path=None, output=None, dataset=None):
+    def __call__(repo_name, repo_accession, repo_url, path=None, output=None, dataset=None,
+                 jobs=None, chunk_size=None):
         # we need this resource file, no point in starting without it
         default_path = opj(dirname(datalad_neuroimaging.__file__), 'resources', 'isatab',
                 'scidata_bids_investigator.txt')
@@ -618,15 +1278,10 @@ class BIDS2Scidata(Interface):
 
         errored = False
         dsmeta = None
-        filemeta = []
-        for m in metadata(
-                path,
-                dataset=dataset,
-                # BIDS hierarchy might go across multiple dataset
-                recursive=True,
-                reporton='all',
-                return_type='generator',
-                result_renderer='disabled'):
+        nfiles = 0
+        # file records are grouped by suffix as they come in
+        suffix_index = {}
+        for m in _iter_metadata(path, dataset, jobs):
             type = m.get('type', None)
             if type not in ('dataset', 'file'):
                 continue
@@ -642,7 +1297,8 @@ class BIDS2Scidata(Interface):
                     continue
                 dsmeta = m
             elif type == 'file':
-                filemeta.append(m)
+                nfiles += 1
+                _add_to_index(suffix_index, m)
         if errored:
             return
 
@@ -657,7 +1313,7 @@ class BIDS2Scidata(Interface):
             return
 
         lgr.info("Metadata for %i files associated with '%s' on record in %s",
-                 len(filemeta),
+                 nfiles,
                  path,
                  dataset)
 
@@ -666,12 +1322,14 @@ class BIDS2Scidata(Interface):
 
         info = convert(
             dsmeta,
-            filemeta,
+            suffix_index,
             output_directory=output,
             repository_info={
                 'Comment[Data Repository]': repo_name,
                 'Comment[Data Record Accession]': repo_accession,
                 'Comment[Data Record URI]': repo_url},
+            jobs=jobs,
+            chunk_size=chunk_size,
         )
         if info is None:
             yield dict(
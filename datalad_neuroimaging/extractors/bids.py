@@ -11,11 +11,6 @@
 from __future__ import absolute_import
 from math import isnan
 
-# use pybids to evolve with the standard without having to track it too much
-import bids
-from bids import BIDSLayout
-
-import re
 from io import open
 from os.path import join as opj
 from os.path import exists
@@ -27,9 +22,17 @@ from datalad.support.external_versions import external_versions
 from datalad_deprecated.metadata.extractors.base import BaseMetadataExtractor
 from datalad_deprecated.metadata.definitions import vocabulary_id
 
+# use pybids to evolve with the standard without having to track it too much
+# (only imported when a layout is needed)
+from .cache import get_bids_layout
+from .instrumentation import (
+    get_instrumentation,
+    null_instrumentation,
+)
+from .utils import get_progress
+
 import logging
 lgr = logging.getLogger('datalad.metadata.extractors.bids')
-from datalad.log import log_progress
 
 
 vocabulary = {
@@ -67,15 +70,20 @@ class MetadataExtractor(BaseMetadataExtractor):
     }
 
     def get_metadata(self, dataset, content):
+        instr = get_instrumentation(self.ds, 'bids')
         derivative_exist = exists(opj(self.ds.path, 'derivatives'))
-        bids = BIDSLayout(self.ds.path, derivatives=derivative_exist)
+        with instr.timer('layout_build'):
+            bids = get_bids_layout(
+                self.ds, self.ds.path, derivatives=derivative_exist)
 
-        dsmeta = self._get_dsmeta(bids)
+        with instr.timer('dataset_metadata'):
+            dsmeta = self._get_dsmeta(bids)
 
         if not content:
+            instr.emit()
             return dsmeta, []
 
-        return dsmeta, self._get_cnmeta(bids)
+        return dsmeta, self._get_cnmeta(bids, instr)
 
     def _get_dsmeta(self, bids):
         context = {}
@@ -122,15 +130,17 @@ class MetadataExtractor(BaseMetadataExtractor):
         meta['@context'] = context
         return meta
 
-    def _get_cnmeta(self, bids):
+    def _get_cnmeta(self, bids, instr=null_instrumentation):
         # TODO any custom handling of participants infos should eventually
         # be done by pybids in one way or another
-        path_props = {}
+        # participant properties, by subject label
+        subject_props = {}
         participants_fname = opj(self.ds.path, 'participants.tsv')
         if exists(participants_fname):
             try:
-                for rx, info in yield_participant_info(bids):
-                    path_props[rx] = {'subject': info}
+                with instr.timer('participants'):
+                    for subject, info in yield_participant_info(bids):
+                        subject_props[subject] = {'subject': info}
             except Exception as exc:
                 if isinstance(exc, ImportError):
                     raise exc
@@ -139,9 +149,8 @@ class MetadataExtractor(BaseMetadataExtractor):
                     exc_str(exc)
                 )
 
-        log_progress(
-            lgr.info,
-            'extractorbids',
+        progress = get_progress(self.ds, lgr.info, 'extractorbids')
+        progress.start(
             'Start BIDS metadata extraction from %s', self.ds,
             total=len(self.paths),
             label='BIDS metadata extraction',
@@ -149,56 +158,56 @@ class MetadataExtractor(BaseMetadataExtractor):
         )
         # now go over all files in the dataset and query pybids for its take
         # on each of them
-        for f in self.paths:
-            absfp = opj(self.ds.path, f)
-            log_progress(
-                lgr.info,
-                'extractorbids',
-                'Extract BIDS metadata from %s', absfp,
-                update=1,
-                increment=True)
-            # BIDS carries a substantial portion of its metadata in JSON
-            # sidecar files. we ignore them here completely
-            # this might yield some false-negatives in theory, but
-            # this case has not been observed in practice yet, hence
-            # doing it cheap for now
-            if f.endswith('.json'):
-                continue
-            md = {}
-            try:
-                md.update(
-                    {k: v
-                     for k, v in bids.get_metadata(
-                         opj(self.ds.path, f),
-                         include_entities=True).items()
-                     # no nested structures for now (can be monstrous when DICOM
-                     # metadata is embedded)
-                     if not isinstance(v, dict)})
-            except ValueError as e:
-                lgr.debug(
-                    'PyBIDS errored on file %s in %s: %s '
-                    '(possibly not BIDS-compliant or not recognized',
-                    f, self.ds, exc_str(e))
-                lgr.debug('no usable BIDS metadata for %s in %s: %s',
-                          f, self.ds, exc_str(e))
-                # do not raise here:
-                # https://github.com/datalad/datalad-neuroimaging/issues/34
-            except Exception as e:
-                lgr.debug('no usable BIDS metadata for %s in %s: %s',
-                          f, self.ds, exc_str(e))
-                if cfg.get('datalad.runtime.raiseonerror'):
-                    raise
-
-            # no check al props from other sources and apply them
-            for rx in path_props:
-                if rx.match(f):
-                    md.update(path_props[rx])
-            yield f, md
-        log_progress(
-            lgr.info,
-            'extractorbids',
-            'Finished BIDS metadata extraction from %s', self.ds
-        )
+        instr.count('files', len(self.paths))
+        try:
+            for f in self.paths:
+                absfp = opj(self.ds.path, f)
+                progress.update('Extract BIDS metadata from %s', absfp)
+                # BIDS carries a substantial portion of its metadata in JSON
+                # sidecar files. we ignore them here completely
+                # this might yield some false-negatives in theory, but
+                # this case has not been observed in practice yet, hence
+                # doing it cheap for now
+                if f.endswith('.json'):
+                    instr.count('files_skipped')
+                    continue
+                md = {}
+                try:
+                    with instr.timer('file_metadata'):
+                        md.update(
+                            {k: v
+                             for k, v in bids.get_metadata(
+                                 absfp,
+                                 include_entities=True).items()
+                             # no nested structures for now (can be monstrous
+                             # when DICOM metadata is embedded)
+                             if not isinstance(v, dict)})
+                except ValueError as e:
+                    lgr.debug(
+                        'PyBIDS errored on file %s in %s: %s '
+                        '(possibly not BIDS-compliant or not recognized',
+                        f, self.ds, exc_str(e))
+                    lgr.debug('no usable BIDS metadata for %s in %s: %s',
+                              f, self.ds, exc_str(e))
+                    # do not raise here:
+                    # https://github.com/datalad/datalad-neuroimaging/issues/34
+                except Exception as e:
+                    lgr.debug('no usable BIDS metadata for %s in %s: %s',
+                              f, self.ds, exc_str(e))
+                    if cfg.get('datalad.runtime.raiseonerror'):
+                        raise
+
+                # no check al props from other sources and apply them
+                props = subject_props.get(_get_subject_label(f))
+                if props:
+                    md.update(props)
+                yield f, md
+        finally:
+            # also close the progress bar, when not all results were
+            # consumed
+            progress.finish(
+                'Finished BIDS metadata extraction from %s', self.ds)
+            instr.emit()
 
 
 def yield_participant_info(bids):
@@ -226,4 +235,18 @@ def yield_participant_info(bids):
             if val:
                 props[hk] = val
         if props:
-            yield re.compile(r'^sub-{}/.*'.format(props['id'])), props
+            yield props['id'], props
+
+
+def _get_subject_label(path):
+    """Return the label of the subject directory a file is located in
+
+    Returns
+    -------
+    str or None
+      None, if the file is not located underneath a subject directory.
+    """
+    subdir, sep, _ = path.partition('/')
+    if not sep or not subdir.startswith('sub-'):
+        return None
+    return subdir[4:]
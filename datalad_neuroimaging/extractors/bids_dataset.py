@@ -8,10 +8,13 @@
 # ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
 """Metadata extractor for BIDS dataset-level information"""
 import logging
-from pathlib import Path
+import os
+from pathlib import (
+    Path,
+    PurePosixPath,
+)
 from uuid import UUID
 
-from bids import BIDSLayout
 from datalad.log import log_progress
 from datalad.utils import ensure_unicode
 from datalad_metalad.extractors.base import (
@@ -21,6 +24,9 @@ from datalad_metalad.extractors.base import (
 )
 from datalad_deprecated.metadata.definitions import vocabulary_id
 
+from .cache import get_bids_layout
+from .instrumentation import get_instrumentation
+
 
 lgr = logging.getLogger("datalad.metadata.extractors.bids_dataset")
 
@@ -74,7 +80,13 @@ BIDSCONTEXT = {
     "type": vocabulary_id,
 }
 
-REQUIRED_BIDS_FILES = ["dataset_description.json"]
+DESCRIPTION_FNAME = "dataset_description.json"
+
+REQUIRED_BIDS_FILES = [DESCRIPTION_FNAME]
+
+# Directories that are only searched for the BIDS root, if it cannot be found
+# anywhere else (in addition to subject and session directories)
+BIDS_SUBTREES_LAST = ["sourcedata", "derivatives", "code", "stimuli"]
 
 DATASET = "dataset"
 
@@ -148,30 +160,11 @@ class BIDSDatasetExtractor(DatasetMetadataExtractor):
     def get_required_content(self):
         # TODO: logging
         # bids_dir = _find_bids_root(self.dataset.path)
+        required = []
         for f in REQUIRED_BIDS_FILES:
             f_abs = self.dataset.pathobj / f
             if f_abs.exists() or f_abs.is_symlink():
-                result = self.dataset.get(f_abs, result_renderer="disabled")
-                failure_count = 0
-                for res in result:
-                    if res["status"] in ("error", "impossible"):
-                        failure_count += 1
-                if failure_count > 0:
-                    yield dict(
-                        path=self.dataset.path,
-                        action="meta_extract",
-                        type="dataset",
-                        status="error",
-                        message=("required file content not retrievable: %s", f),
-                    )
-                else:
-                    yield dict(
-                        path=self.dataset.path,
-                        action="meta_extract",
-                        type="dataset",
-                        status="ok",
-                        message=("required file(s) retrieved"),
-                    )
+                required.append(f_abs)
             else:
                 yield dict(
                     path=self.dataset.path,
@@ -184,6 +177,32 @@ class BIDSDatasetExtractor(DatasetMetadataExtractor):
                         f,
                     ),
                 )
+        readmes = _get_readme_paths(self.dataset.path)
+        # retrieve the content of all files at once
+        failed = _get_content(self.dataset, required + readmes)
+        for f_abs in required:
+            if f_abs in failed:
+                yield dict(
+                    path=self.dataset.path,
+                    action="meta_extract",
+                    type="dataset",
+                    status="error",
+                    message=("required file content not retrievable: %s",
+                             f_abs.relative_to(self.dataset.pathobj)),
+                )
+            else:
+                yield dict(
+                    path=self.dataset.path,
+                    action="meta_extract",
+                    type="dataset",
+                    status="ok",
+                    message=("required file(s) retrieved"),
+                )
+        # a README is not required, go on without it
+        for f_abs in readmes:
+            if f_abs in failed:
+                lgr.warning("README content not retrievable, ignoring: %s",
+                            f_abs)
         return
 
     def extract(self, _=None) -> ExtractorResult:
@@ -219,20 +238,26 @@ class BIDSmeta(object):
         """
         Function to load BIDSLayout and trigger metadata extraction
         """
-        bids_dir = _find_bids_root(self.dataset.path)
+        instr = get_instrumentation(self.dataset, "bids_dataset")
+        with instr.timer("bids_root"):
+            bids_dir = _find_bids_root(self.dataset.path, self.dataset.repo)
         # Check if derivatives are in BIDS dataset
         deriv_dir = bids_dir / "derivatives"
         derivative_exist = deriv_dir.exists()
         # TODO: handle case with amoty or nonexisting derivatives directory
         # TODO: decide what to do with meta_data from derivatives, if anything
         # Call BIDSLayout with dataset path and derivatives boolean
-        bids = BIDSLayout(bids_dir, derivatives=derivative_exist)
-        dsmeta = self._get_dsmeta(bids)
+        with instr.timer("layout_build"):
+            bids = get_bids_layout(
+                self.dataset, bids_dir, derivatives=derivative_exist)
+        with instr.timer("dataset_metadata"):
+            dsmeta = self._get_dsmeta(bids)
         log_progress(
             lgr.info,
             "extractorsbidsdataset",
             f"Finished bids_dataset metadata extraction from {bids_dir}",
         )
+        instr.emit()
         return dsmeta
 
     def _get_dsmeta(self, bids):
@@ -271,12 +296,13 @@ class BIDSmeta(object):
     def _get_bids_readme(self):
         """Get text from README, if any"""
         readme = []
-        # Grab all readme files, loop through
-        for README_fname in [
-            file for file in Path(self.dataset.path).glob("[Rr][Ee][Aa][Dd][Mm][Ee]*")
-        ]:
-            # datalad get content if annexed
-            self.dataset.get(README_fname)
+        # Grab all readme files
+        readme_fnames = _get_readme_paths(self.dataset.path)
+        # datalad get content if annexed, and not yet present
+        _get_content(
+            self.dataset, [f for f in readme_fnames if not f.exists()])
+        # loop through readme files
+        for README_fname in readme_fnames:
             # read text from file
             try:
                 file_text = ensure_unicode(README_fname.read_bytes()).strip()
@@ -322,23 +348,154 @@ class BIDSmeta(object):
         return variables
 
 
-def _find_bids_root(dataset_path) -> Path:
+def _get_readme_paths(dataset_path):
+    """Return the paths of all README files in the dataset root"""
+    return list(Path(dataset_path).glob("[Rr][Ee][Aa][Dd][Mm][Ee]*"))
+
+
+def _get_content(dataset, paths):
+    """Retrieve the content of files with a single `get` call
+
+    Returns
+    -------
+    set
+      Paths for which the content could not be retrieved.
+    """
+    if not paths:
+        return set()
+    return set(
+        Path(res["path"])
+        for res in dataset.get(
+            paths,
+            on_failure="ignore",
+            return_type="generator",
+            result_renderer="disabled")
+        if res["status"] in ("error", "impossible")
+    )
+
+
+def _find_bids_root(dataset_path, repo=None) -> Path:
     """
     Find relative location of BIDS directory within datalad dataset
+
+    The BIDS root is the directory with the shallowest
+    'dataset_description.json'. Directories with names starting with a dot
+    are not considered. Directories that typically contain nested BIDS
+    datasets or large numbers of files (see `BIDS_SUBTREES_LAST`) are only
+    considered if no 'dataset_description.json' exists elsewhere.
+
+    If a repository is given, tracked files are looked up in its index
+    first, and the work tree is only searched for matches that are not
+    ranked behind those.
     """
-    description_paths = list(Path(dataset_path).glob("**/dataset_description.json"))
-    # 1 - if more than one, select first and output warning
-    # 2 - if zero, output error
-    # 3 - if 1, add to dataset path and set ats bids root dir
-    if len(description_paths) == 0:
+    found = []
+    if repo is not None:
+        found.append(_find_bids_root_in_index(repo))
+    limit = found[0][0] if found and found[0] else None
+    found.append(_find_bids_root_in_worktree(dataset_path, limit))
+    found = [f for f in found if f]
+    if not found:
         msg = ("The file 'dataset_description.json' should be part of the BIDS dataset "
         "in order for the 'bids_dataset' extractor to function correctly")
         raise FileNotFoundError(msg)
-    elif len(description_paths) > 1:
-        msg = (f"Multiple 'dataset_description.json' files ({len(description_paths)}) "
-        f"were found in the recursive filetree of {dataset_path}, selecting "
-        "first path.")
+    rank = min(r for r, _ in found)
+    candidates = set(d for r, dirs in found if r == rank for d in dirs)
+    return Path(dataset_path) / _select_bids_root(
+        list(candidates), dataset_path)
+
+
+def _select_bids_root(candidates, dataset_path):
+    """Select the BIDS root among directories with a dataset description
+
+    Parameters
+    ----------
+    candidates : list of PurePosixPath
+      Directories relative to the dataset root, all at the same depth.
+    """
+    if len(candidates) > 1:
+        candidates = sorted(candidates)
+        msg = (f"Multiple 'dataset_description.json' files ({len(candidates)}) "
+        f"were found at the same level of the filetree of {dataset_path}, "
+        f"selecting '{candidates[0]}'.")
         lgr.warning(msg)
-        return Path(description_paths[0]).parent
-    else:
-        return Path(description_paths[0]).parent
+    return candidates[0]
+
+
+def _is_bids_subtree_last(name):
+    return name in BIDS_SUBTREES_LAST or name.startswith(('sub-', 'ses-'))
+
+
+def _find_bids_root_in_index(repo):
+    """Search the git index for the BIDS root
+
+    Returns
+    -------
+    tuple or None
+      Rank of the matches, see `_find_bids_root_in_worktree()`, and list of
+      PurePosixPath of the directories with a match of that rank.
+    """
+    candidates = {}
+    for f in repo.call_git_items_(
+            ['ls-files', '-z', '--', f':(glob)**/{DESCRIPTION_FNAME}'],
+            read_only=True, sep='\0'):
+        if not f:
+            continue
+        d = PurePosixPath(f).parent
+        if any(p.startswith('.') for p in d.parts):
+            continue
+        key = (any(_is_bids_subtree_last(p) for p in d.parts), len(d.parts))
+        candidates.setdefault(key, []).append(d)
+    if not candidates:
+        return None
+    rank = min(candidates)
+    return rank, candidates[rank]
+
+
+def _find_bids_root_in_worktree(dataset_path, limit=None):
+    """Breadth-first search of the work tree for the BIDS root
+
+    Subtrees that are left for last are searched breadth-first as well,
+    after everything else. The search stops at the first level with a match.
+
+    Parameters
+    ----------
+    limit : tuple, optional
+      Do not search for matches that are ranked behind this one.
+
+    Returns
+    -------
+    tuple or None
+      Rank of the matches, i.e. whether they are in a subtree that is left
+      for last and their depth, and list of PurePosixPath of the
+      directories with a match.
+    """
+    root = Path(dataset_path)
+    # directories to search by depth, for the subtrees left for last and
+    # everything else
+    pending = {False: {0: [PurePosixPath()]}, True: {}}
+    for last in (False, True):
+        levels = pending[last]
+        while levels:
+            depth = min(levels)
+            if limit is not None and (last, depth) > limit:
+                return None
+            level = levels.pop(depth)
+            candidates = [
+                d for d in level
+                if os.path.lexists(root / d / DESCRIPTION_FNAME)]
+            if candidates:
+                return (last, depth), candidates
+            if limit is not None and (last, depth + 1) > limit:
+                # nothing further down can rank before the limit
+                return None
+            for d in level:
+                try:
+                    entries = list(os.scandir(root / d))
+                except OSError:
+                    continue
+                for e in entries:
+                    if e.name.startswith('.') or not e.is_dir(follow_symlinks=False):
+                        continue
+                    pending[last or _is_bids_subtree_last(e.name)].setdefault(
+                        depth + 1, []).append(d / e.name)
+    return None
@@ -0,0 +1,268 @@
+# emacs: -*- mode: python; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Persistent caches for metadata extractors"""
+
+import hashlib
+import json
+import logging
+import os
+import os.path as op
+import sqlite3
+import time
+from shutil import rmtree
+
+from datalad.support.annexrepo import AnnexRepo
+from datalad.support.constraints import EnsureBool
+from datalad.support.external_versions import external_versions
+
+lgr = logging.getLogger('datalad.metadata.extractors.cache')
+
+# location of all extractor caches, relative to the .git directory of a
+# dataset
+CACHE_DIR = op.join('datalad', 'cache', 'neuroimaging')
+
+
+def get_cache_dir(ds):
+    """Return the path of the directory with all extractor caches of a dataset
+    """
+    return op.join(str(ds.repo.dot_git), CACHE_DIR)
+
+
+def purge_cache_dir(ds, name=None):
+    """Remove extractor caches of a dataset
+
+    Parameters
+    ----------
+    ds : Dataset
+    name : str, optional
+      Name of a particular cache (file or directory) in the cache directory.
+      If not given, all caches are removed.
+
+    Returns
+    -------
+    list
+      Paths of all removed caches.
+    """
+    cache_dir = get_cache_dir(ds)
+    if not op.isdir(cache_dir):
+        return []
+    targets = sorted(os.listdir(cache_dir)) if name is None else [name]
+    removed = []
+    for t in targets:
+        tpath = op.join(cache_dir, t)
+        if op.isdir(tpath):
+            rmtree(tpath)
+        elif op.lexists(tpath):
+            os.unlink(tpath)
+        else:
+            continue
+        removed.append(tpath)
+    return removed
+
+
+def get_bids_layout(ds, root, **kwargs):
+    """Create a PyBIDS layout, reusing a persistent index if possible
+
+    If enabled by the ``datalad.metadata.bids.layout-cache`` configuration,
+    the layout index is stored in the cache directory of the dataset, in a
+    subdirectory for the dataset's HEAD commit, with one index per root and
+    set of arguments. An index is reused as long as the dataset is in the
+    same, clean state. On any change, indexes are rebuilt and those of any
+    other state are removed.
+
+    Parameters
+    ----------
+    ds : Dataset
+    root : str or Path
+      Root directory of the BIDS dataset, can be a subdirectory of `ds`.
+    **kwargs
+      Passed on to BIDSLayout.
+
+    Returns
+    -------
+    BIDSLayout
+    """
+    from bids import BIDSLayout
+    if not ds.config.obtain(
+            'datalad.metadata.bids.layout-cache',
+            default=False, valtype=EnsureBool()):
+        return BIDSLayout(root, **kwargs)
+    repo = ds.repo
+    head = repo.get_hexsha()
+    if head is None or repo.dirty:
+        lgr.debug('Not using a persistent BIDS layout index for %s, '
+                  'dataset is not in a committed state', ds)
+        return BIDSLayout(root, **kwargs)
+    cache_dir = op.join(get_cache_dir(ds), 'bids-layout')
+    key = hashlib.md5(json.dumps(
+        [str(root), external_versions['bids'], kwargs],
+        sort_keys=True, default=str).encode()).hexdigest()
+    db_path = op.join(cache_dir, head, key)
+    if op.exists(db_path):
+        try:
+            return BIDSLayout(root, database_path=db_path, **kwargs)
+        except Exception as e:
+            lgr.debug('Cannot load BIDS layout index from %s, rebuilding: %s',
+                      db_path, e)
+            rmtree(db_path)
+    # indexes of any other state of the dataset will not be used again,
+    # but those of other roots (e.g. of another extractor) might be
+    if op.isdir(cache_dir):
+        for d in os.listdir(cache_dir):
+            if d != head:
+                rmtree(op.join(cache_dir, d))
+    os.makedirs(op.join(cache_dir, head), exist_ok=True)
+    return BIDSLayout(root, database_path=db_path, **kwargs)
+
+
+def get_content_ids(ds, paths):
+    """Determine identifiers for the content of files in a dataset
+
+    Annexed files are identified by their annex key, any other file by the
+    SHA of its git blob. Unless a file is a symlink into the annex, which
+    cannot be modified in place, size and modification time of the file are
+    added to the identifier to account for modifications in the work tree.
+
+    Parameters
+    ----------
+    ds : Dataset
+    paths : list
+      Paths relative to the dataset root.
+
+    Returns
+    -------
+    dict
+      Mapping of relative paths to content identifiers. Files not known
+      to git have no record.
+    """
+    repo = ds.repo
+    if not paths:
+        return {}
+    if isinstance(repo, AnnexRepo):
+        info = repo.get_content_annexinfo(
+            paths=paths, eval_availability=False)
+    else:
+        info = repo.get_content_info(paths=paths)
+    ids = {}
+    for f in paths:
+        props = info.get(repo.pathobj / f)
+        if not props:
+            continue
+        cid = props.get('key') or props.get('gitshasum')
+        if not cid:
+            continue
+        fpath = op.join(ds.path, f)
+        if not (props.get('key') and op.islink(fpath)):
+            try:
+                st = os.stat(fpath)
+            except OSError:
+                continue
+            cid = '{}-{}-{}'.format(cid, st.st_size, st.st_mtime_ns)
+        ids[f] = cid
+    return ids
+
+
+class MetadataCache(object):
+    """Size-bounded persistent cache for JSON-serializable records
+
+    Records are stored in an SQLite database. When the cache is closed,
+    the least recently used records are evicted until the total size of
+    all records no longer exceeds the configured limit.
+
+    Parameters
+    ----------
+    path : str
+      Location of the database file. Leading directories are created
+      as needed.
+    profile : str
+      Identifies the extraction setup (e.g. software versions) that
+      produced the cached records. Any existing records are discarded,
+      when it does not match the profile on record.
+    maxsize : int
+      Maximum total size of all records in bytes.
+    """
+    def __init__(self, path, profile, maxsize):
+        self.path = path
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(op.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS records (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                atime REAL NOT NULL);
+            CREATE TABLE IF NOT EXISTS properties (
+                name TEXT PRIMARY KEY,
+                value TEXT NOT NULL);
+        """)
+        rec = self._db.execute(
+            "SELECT value FROM properties WHERE name = 'profile'").fetchone()
+        if rec is None or rec[0] != profile:
+            if rec is not None:
+                lgr.debug(
+                    'Discard cached records in %s from a different '
+                    'extraction setup', path)
+            self._db.execute("DELETE FROM records")
+            self._db.execute(
+                "INSERT OR REPLACE INTO properties VALUES ('profile', ?)",
+                (profile,))
+            self._db.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def keys(self):
+        """Return the set of keys of all cached records"""
+        return set(r[0] for r in self._db.execute("SELECT key FROM records"))
+
+    def get(self, key, default=None):
+        rec = self._db.execute(
+            "SELECT value FROM records WHERE key = ?", (key,)).fetchone()
+        if rec is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self._db.execute(
+            "UPDATE records SET atime = ? WHERE key = ?", (time.time(), key))
+        return json.loads(rec[0])
+
+    def set(self, key, value):
+        try:
+            value = json.dumps(value)
+        except (TypeError, ValueError) as e:
+            lgr.debug('Not caching record %s: %s', key, e)
+            return
+        self._db.execute(
+            "INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?)",
+            (key, value, len(value), time.time()))
+
+    def close(self):
+        if self._db is None:
+            return
+        # evict the least recently used records beyond the size limit
+        evicted = self._db.execute("""
+            DELETE FROM records WHERE key IN (
+                SELECT key FROM (
+                    SELECT key, SUM(size) OVER (
+                        ORDER BY atime DESC, key) AS cumsize
+                    FROM records)
+                WHERE cumsize > ?)
+            """, (self.maxsize,)).rowcount
+        self._db.commit()
+        self._db.close()
+        self._db = None
+        lgr.debug(
+            'Closed cache %s (hits: %i, misses: %i, evicted: %i)',
+            self.path, self.hits, self.misses, evicted)
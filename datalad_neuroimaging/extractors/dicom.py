@@ -9,23 +9,21 @@
 """DICOM metadata extractor"""
 from __future__ import absolute_import
 
+import json
+import os
+from collections import deque
 import os.path as op
 import logging
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 lgr = logging.getLogger('datalad.metadata.extractors.dicom')
-from datalad.log import log_progress
-from datalad.support.exceptions import CapturedException
+from datalad.support.exceptions import (
+    CapturedException,
+    CommandError,
+)
+from datalad.support.constraints import EnsureBool
 from datalad.support.external_versions import external_versions
-
-import pydicom as dcm
-from pydicom.errors import InvalidDicomError
-
-NOT_IMPLEMENTED_TYPES = tuple() # (FileDataset,)
-if external_versions["pydicom"] >= "3":
-    # everything is a FileDataset now, so we will decide based on have a UID
-    pass
-else:
-    from pydicom.dicomdir import DicomDir
-    NOT_IMPLEMENTED_TYPES = (DicomDir,)
+from datalad.utils import ensure_list
 
 try:
     from collections.abc import MutableSequence
@@ -35,15 +33,64 @@ except ImportError:
 from datalad_deprecated.metadata.definitions import vocabulary_id
 from datalad_deprecated.metadata.extractors.base import BaseMetadataExtractor
 
-PersonName = dcm.valuerep.PersonName
+from .cache import (
+    MetadataCache,
+    get_cache_dir,
+    get_content_ids,
+)
+from .instrumentation import (
+    Instrumentation,
+    get_instrumentation,
+    null_instrumentation,
+)
+from .utils import get_progress
+
+# must be incremented whenever the cached header information changes
+_cache_version = 1
+# name of the file with the series descriptions of the last extraction
+_series_state_fname = 'dicom-series.json'
+# files with these extensions are not even opened, DICOM files rarely have
+# an extension at all, and never any of these
+_non_dicom_exts = (
+    '.bval', '.bvec', '.csv', '.json', '.md', '.nii', '.nii.gz', '.tsv',
+    '.txt')
+# DICOM file signature, following a 128 byte preamble
+_dicom_magic = b'DICM'
+
+# pydicom and anything that depends on it is only set up by
+# _load_pydicom(), when headers are actually read, because importing pydicom
+# is expensive
+dcm = None
+PersonName = None
 # Data types we care to extract/handle
-_SCALAR_TYPES = (
-    int, float, str, dcm.valuerep.DSfloat, dcm.valuerep.IS,
-    PersonName)
-# Since pydicom 1.0 MultiValue is no longer subclass of list
-# but of collections{.abc,}.MutableSequence . To make sure we
-# do not miss any of those - match to both
-_SEQUENCE_TYPES = (list, tuple, dcm.multival.MultiValue, MutableSequence)
+_SCALAR_TYPES = None
+_SEQUENCE_TYPES = None
+NOT_IMPLEMENTED_TYPES = tuple() # (FileDataset,)
+
+
+def _load_pydicom():
+    """Import pydicom and set up the data types that depend on it"""
+    global dcm, PersonName, _SCALAR_TYPES, _SEQUENCE_TYPES, \
+        NOT_IMPLEMENTED_TYPES
+    if dcm is not None:
+        return
+    import pydicom
+    if external_versions["pydicom"] >= "3":
+        # everything is a FileDataset now, so we will decide based on have a UID
+        pass
+    else:
+        from pydicom.dicomdir import DicomDir
+        NOT_IMPLEMENTED_TYPES = (DicomDir,)
+    PersonName = pydicom.valuerep.PersonName
+    _SCALAR_TYPES = (
+        int, float, str, pydicom.valuerep.DSfloat, pydicom.valuerep.IS,
+        PersonName)
+    # Since pydicom 1.0 MultiValue is no longer subclass of list
+    # but of collections{.abc,}.MutableSequence . To make sure we
+    # do not miss any of those - match to both
+    _SEQUENCE_TYPES = (
+        list, tuple, pydicom.multival.MultiValue, MutableSequence)
+    dcm = pydicom
 
 
 def _is_good_type(v):
@@ -126,85 +173,633 @@ class MetadataExtractor(BaseMetadataExtractor):
     }
 
     def get_metadata(self, dataset, content):
+        _load_pydicom()
         imgseries = {}
-        imgs = {}
-        log_progress(
-            lgr.info,
-            'extractordicom',
+        imgs = FileMetadata()
+        # number of processes to use for reading DICOM headers
+        jobs = self.ds.config.obtain(
+            'datalad.metadata.dicom.jobs', default=1, valtype=int)
+        incremental = self.ds.config.obtain(
+            'datalad.metadata.dicom.incremental',
+            default=False, valtype=EnsureBool())
+        tags = self._get_tag_allowlist()
+        instr = get_instrumentation(self.ds, 'dicom')
+        state = None
+        if incremental and not content:
+            state = self._load_series_state(tags)
+        if state is not None:
+            imgseries, paths = self._get_series_update(state)
+        else:
+            paths = self.paths
+        instr.count('files', len(paths))
+        candidates = [f for f in paths
+                      if not f.lower().endswith(_non_dicom_exts)]
+        if len(candidates) < len(paths):
+            lgr.debug('Not considering %i files with a non-DICOM extension',
+                      len(paths) - len(candidates))
+            instr.count('files_filtered', len(paths) - len(candidates))
+            instr.count('files_skipped', len(paths) - len(candidates))
+        paths = candidates
+        progress = get_progress(self.ds, lgr.info, 'extractordicom')
+        progress.start(
             'Start DICOM metadata extraction from %s', self.ds,
-            total=len(self.paths),
+            total=len(paths),
             label='DICOM metadata extraction',
             unit=' Files',
         )
-        for f in self.paths:
-            absfp = op.join(self.ds.path, f)
-            log_progress(
-                lgr.info,
-                'extractordicom',
-                'Extract DICOM metadata from %s', absfp,
-                update=1,
-                increment=True)
-
-            if op.basename(f).startswith('PSg'):
-                # ignore those dicom files, since they appear to not contain
-                # any relevant metadata for image series, but causing trouble
-                # (see gh-2210). We might want to change that whenever we get
-                # a better understanding of how to deal with those files.
-                lgr.debug("Ignoring DICOM file %s", f)
-                continue
+        cache = self._get_header_cache(tags)
+        try:
+            for f, uid, ddict, getval in self._iter_dicom_info(
+                    paths, content, jobs, cache, tags, progress, instr):
+                if content:
+                    imgs.add(f, uid, ddict)
+                with instr.timer('series_merge'):
+                    _add_to_series(imgseries, f, uid, ddict, getval)
+        finally:
+            if cache is not None:
+                instr.count('cache_hits', cache.hits)
+                instr.count('cache_misses', cache.misses)
+                cache.close()
+        if state is not None:
+            imgseries = self._sort_series(imgseries)
+        if incremental:
+            self._save_series_state(imgseries, tags)
+        progress.finish('Finished DICOM metadata extraction from %s', self.ds)
+        instr.emit()
+
+        dsmeta = {
+            '@context': context,
+            'Series': [series.description for series in imgseries.values()]
+        }
+        return (
+            dsmeta,
+            # the caller processes the series descriptions before any file
+            # record, hence records can only be released as they are consumed
+            imgs.consume() if content else []
+        )
 
+    def _get_profile(self, tags):
+        """Return a description of the extraction setup for cached records
+        """
+        return '{} pydicom {} tags {}'.format(
+            _cache_version, external_versions['pydicom'],
+            ','.join(str(t) for t in tags) if tags else 'all')
+
+    def _load_series_state(self, tags):
+        """Load the series descriptions of a previous extraction
+
+        Returns
+        -------
+        dict or None
+          None, if there is no usable state.
+        """
+        state_path = op.join(get_cache_dir(self.ds), _series_state_fname)
+        if not op.exists(state_path):
+            return None
+        try:
+            with open(state_path) as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            lgr.debug('Cannot load DICOM series state from %s: %s',
+                      state_path, CapturedException(e))
+            return None
+        if state.get('profile') != self._get_profile(tags):
+            lgr.debug('Ignoring DICOM series state from a different '
+                      'extraction setup')
+            return None
+        return state
+
+    def _save_series_state(self, imgseries, tags):
+        """Store the series descriptions for a subsequent extraction
+
+        The state is only stored for a dataset without uncommitted changes,
+        which is later compared against the HEAD commit at the time of
+        extraction.
+        """
+        repo = self.ds.repo
+        state_path = op.join(get_cache_dir(self.ds), _series_state_fname)
+        refcommit = repo.get_hexsha()
+        if refcommit is None or repo.dirty:
+            lgr.debug('Not storing DICOM series state for %s, dataset is not '
+                      'in a committed state', self.ds)
+            if op.lexists(state_path):
+                os.unlink(state_path)
+            return
+        state = {
+            'profile': self._get_profile(tags),
+            'refcommit': refcommit,
+            'paths': self.paths,
+            'series': [[uid, series.description, series.files]
+                       for uid, series in imgseries.items()],
+        }
+        os.makedirs(op.dirname(state_path), exist_ok=True)
+        try:
+            with open(state_path + '.tmp', 'w') as f:
+                json.dump(state, f)
+        except (TypeError, ValueError) as e:
+            lgr.debug('Cannot store DICOM series state: %s',
+                      CapturedException(e))
+            os.unlink(state_path + '.tmp')
+            return
+        os.replace(state_path + '.tmp', state_path)
+
+    def _get_series_update(self, state):
+        """Determine which series descriptions of a previous state remain valid
+
+        Returns
+        -------
+        dict, list
+          Mapping of SeriesInstanceUIDs to `ImageSeries` that are
+          unaffected by any change, and
+          the files that need to be (re-)processed to obtain the series
+          descriptions for `self.paths`.
+        """
+        imgseries = {uid: ImageSeries(description, files)
+                     for uid, description, files in state['series']}
+        modified = self._get_modified_paths(state['refcommit'])
+        if modified is None:
+            # start over
+            return {}, self.paths
+        known = set(state['paths'])
+        current = set(self.paths)
+        removed = (known - current) | (modified & known)
+        added = (current - known) | (modified & current)
+        # any series with a removed file needs to be reassembled from the
+        # remaining files
+        redo = set()
+        for uid in list(imgseries):
+            files = imgseries[uid].files
+            if removed.intersection(files):
+                del imgseries[uid]
+                redo.update(f for f in files if f not in removed)
+        lgr.debug('Updating DICOM series state: %i added, %i removed, '
+                  '%i to process again', len(added - known), len(removed),
+                  len(redo))
+        return imgseries, [f for f in self.paths if f in added or f in redo]
+
+    def _get_modified_paths(self, refcommit):
+        """Return the set of files with changes since a commit
+
+        Returns
+        -------
+        set or None
+          None, if the commit is not known.
+        """
+        try:
+            return set(
+                f for f in self.ds.repo.call_git_items_(
+                    ['diff', '--name-only', '--no-renames', '-z',
+                     refcommit, '--'],
+                    sep='\0', read_only=True)
+                if f)
+        except CommandError as e:
+            lgr.debug('Cannot determine changes since %s: %s',
+                      refcommit, CapturedException(e))
+            return None
+
+    def _sort_series(self, imgseries):
+        """Order series and their files as a complete extraction would"""
+        order = {f: i for i, f in enumerate(self.paths)}
+        for series in imgseries.values():
+            series.files.sort(key=order.__getitem__)
+        return dict(sorted(
+            imgseries.items(), key=lambda i: order[i[1].files[0]]))
+
+    def _get_tag_allowlist(self):
+        """Return the sorted list of DICOM tags to read, if configured
+
+        Returns
+        -------
+        list or None
+          None, if all tags shall be read.
+        """
+        spec = self.ds.config.get('datalad.metadata.dicom.tags', get_all=True)
+        if not spec:
+            return None
+        from pydicom.tag import Tag
+        tags = set()
+        for kw in (k for s in ensure_list(spec)
+                   for k in s.replace(',', ' ').split()):
             try:
-                d = dcm.dcmread(absfp, defer_size=1000, stop_before_pixels=True)
-            except InvalidDicomError as exc:
-                # we can only ignore
-                lgr.debug('"%s" does not look like a DICOM file, skipped: %s',
-                          absfp,
-                          CapturedException(exc))
-                continue
+                tags.add(Tag(kw))
+            except ValueError:
+                lgr.warning('Ignoring unknown DICOM tag %r in '
+                            'datalad.metadata.dicom.tags', kw)
+        if not tags:
+            return None
+        # always needed to group images into series
+        tags.add(Tag('SeriesInstanceUID'))
+        return sorted(tags)
+
+    def _get_header_cache(self, tags):
+        """Return the persistent DICOM header cache, if enabled"""
+        if not self.ds.config.obtain(
+                'datalad.metadata.dicom.cache',
+                default=False, valtype=EnsureBool()):
+            return None
+        maxsize = self.ds.config.obtain(
+            'datalad.metadata.dicom.cache-size', default=1024, valtype=int)
+        return MetadataCache(
+            op.join(get_cache_dir(self.ds), 'dicom.sqlite'),
+            profile=self._get_profile(tags),
+            maxsize=maxsize * 1024 * 1024,
+        )
+
+    def _iter_dicom_info(self, paths, content, jobs, cache, tags, progress,
+                         instr=null_instrumentation):
+        """Yield header information for all DICOM files in `paths`
 
-            if NOT_IMPLEMENTED_TYPES and isinstance(d, NOT_IMPLEMENTED_TYPES):
-                lgr.debug("%s appears to be a DICOMDIR or alike: got %s. Extraction not yet"
-                          " implemented, skipped", f, d)
+        Headers of files with a record in the cache are not read again,
+        all others are read serially, or by `jobs` processes in parallel.
+        If `tags` are given, only these tags are read from a header.
+        Every file is reported to the `ThrottledProgress` `progress`. Time
+        spent and files processed are accounted in `instr`.
+
+        Yields
+        ------
+        tuple
+          Relative path, SeriesInstanceUID, `_struct2dict()` output (or None,
+          if not needed), and a callable to query the converted value of
+          any header field.
+        """
+        content_ids = {}
+        cached_ids = set()
+        todo = paths
+        if cache is not None:
+            content_ids = get_content_ids(self.ds, paths)
+            cached_ids = cache.keys()
+            todo = [f for f in paths
+                    if content_ids.get(f) not in cached_ids]
+            lgr.debug('Found cached DICOM header information for %i of %i '
+                      'files', len(paths) - len(todo), len(paths))
+        if jobs > 1 and len(todo) > 1:
+            infos = self._read_headers_parallel(todo, jobs, tags, instr)
+        else:
+            infos = self._read_headers(
+                todo,
+                # with a cache, everything needs to be converted
+                full=content or cache is not None,
+                tags=tags,
+                instr=instr)
+        for f in paths:
+            progress.update_file('Extract DICOM metadata from %s', f)
+            cid = content_ids.get(f)
+            if cid in cached_ids:
+                info = cache.get(cid)
+                if info is not None:
+                    uid, ddict = info
+                    info = uid, ddict, ddict.get
+            else:
+                info = next(infos)
+                if cid is not None:
+                    cache.set(cid, info[:2] if info else None)
+            if info is None:
+                instr.count('files_skipped')
                 continue
-            elif not hasattr(d, 'SeriesInstanceUID'):
-                lgr.debug("%s does not have SeriesInstanceUID, skipped", f)
+            yield (f,) + tuple(info)
+
+    def _read_headers(self, paths, full, tags=None,
+                      instr=null_instrumentation):
+        """Read DICOM headers one after another
+
+        Parameters
+        ----------
+        paths : list
+        full : bool
+          If False, headers are only converted completely for the first file
+          in a series.
+        tags : list, optional
+          See `_read_dicom()`.
+        instr : Instrumentation, optional
+
+        Yields
+        ------
+        tuple or None
+          SeriesInstanceUID, `_struct2dict()` output (or None), and a callable
+          to query the converted value of any header field. None for files
+          that were skipped.
+        """
+        known_series = set()
+        for f in paths:
+            d = _read_dicom(op.join(self.ds.path, f), f, tags, instr)
+            if d is None:
+                yield None
                 continue
+            uid = d.SeriesInstanceUID
             ddict = None
-            if content:
-                ddict = _struct2dict(d)
-                imgs[f] = ddict
-            if d.SeriesInstanceUID not in imgseries:
-                # start with a copy of the metadata of the first dicom in a series
-                series = _struct2dict(d) if ddict is None else ddict.copy()
-                # store directory containing the image series (good for sorted
-                # DICOM datasets)
-                series_dir = op.dirname(f)
-                series['SeriesDirectory'] = series_dir if series_dir else op.curdir
-                series_files = []
+            if full or uid not in known_series:
+                with instr.timer('conversion'):
+                    ddict = _struct2dict(d)
+            known_series.add(uid)
+            # compare against the converted header, if there is one already
+            yield uid, ddict, ddict.get if ddict is not None \
+                else lambda k, d=d: _convert_value(getattr(d, k, None))
+
+    def _read_headers_parallel(self, paths, jobs, tags=None,
+                               instr=null_instrumentation):
+        """Read DICOM headers using a pool of `jobs` processes
+
+        Workers only report compact dictionaries with the converted header
+        fields, in the order of `paths`. Series descriptions are assembled
+        in the parent process. Time spent by the workers is accounted in
+        `instr` as well, hence timers can exceed the duration of the
+        extraction.
+        """
+        chunksize = max(1, min(64, len(paths) // (jobs * 4)))
+        lgr.debug('Reading DICOM headers with %i processes', jobs)
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            for res in executor.map(
+                    _get_dicom_info,
+                    [op.join(self.ds.path, f) for f in paths],
+                    paths,
+                    repeat(tags),
+                    repeat(instr.enabled),
+                    chunksize=chunksize):
+                if instr.enabled:
+                    res, stats = res
+                    instr.merge(stats)
+                if res is None:
+                    yield None
+                    continue
+                uid, ddict = res
+                yield uid, ddict, ddict.get
+
+
+def _read_dicom(absfp, f, tags=None, instr=null_instrumentation):
+    """Read the header of a single DICOM file
+
+    Parameters
+    ----------
+    absfp : str
+      Absolute path of the file.
+    f : str
+      Path of the file relative to the dataset root.
+    tags : list, optional
+      Sorted list of tags to read. If given, the values of any other data
+      elements are not read, and reading stops after the last tag in
+      the list.
+    instr : Instrumentation, optional
+
+    Returns
+    -------
+    pydicom.Dataset or None
+      None is returned for any file that does not qualify for metadata
+      extraction.
+    """
+    _load_pydicom()
+    from pydicom.errors import InvalidDicomError
+    from pydicom.filereader import read_partial
+
+    if op.basename(f).startswith('PSg'):
+        # ignore those dicom files, since they appear to not contain
+        # any relevant metadata for image series, but causing trouble
+        # (see gh-2210). We might want to change that whenever we get
+        # a better understanding of how to deal with those files.
+        lgr.debug("Ignoring DICOM file %s", f)
+        return None
+
+    try:
+        with instr.timer('file_open'):
+            fp = open(absfp, 'rb')
+        with fp:
+            # pydicom would refuse a file without the signature too, but
+            # only after setting up a lot more
+            if fp.read(132)[128:] != _dicom_magic:
+                lgr.debug('"%s" has no DICOM file signature, skipped', absfp)
+                instr.count('files_filtered')
+                return None
+            fp.seek(0)
+            with instr.timer('header_parse'):
+                if tags:
+                    d = read_partial(
+                        fp,
+                        _stop_after(tags[-1]),
+                        defer_size=1000,
+                        specific_tags=tags)
+                else:
+                    d = dcm.dcmread(
+                        fp, defer_size=1000, stop_before_pixels=True)
+            instr.count('bytes_read', fp.tell())
+    except InvalidDicomError as exc:
+        # we can only ignore
+        lgr.debug('"%s" does not look like a DICOM file, skipped: %s',
+                  absfp,
+                  CapturedException(exc))
+        return None
+
+    if NOT_IMPLEMENTED_TYPES and isinstance(d, NOT_IMPLEMENTED_TYPES):
+        lgr.debug("%s appears to be a DICOMDIR or alike: got %s. Extraction not yet"
+                  " implemented, skipped", f, d)
+        return None
+    elif not hasattr(d, 'SeriesInstanceUID'):
+        lgr.debug("%s does not have SeriesInstanceUID, skipped", f)
+        return None
+    return d
+
+
+def _stop_after(last_tag):
+    """Return a `read_partial()` stop condition for data elements after a tag
+    """
+    from pydicom.tag import Tag
+    pixel_data = Tag('PixelData')
+
+    def stop_when(tag, vr, length):
+        return tag > last_tag or tag == pixel_data
+    return stop_when
+
+
+def _get_dicom_info(absfp, f, tags=None, instrumented=False):
+    """Worker for parallel header reading
+
+    Returns
+    -------
+    tuple or None
+      SeriesInstanceUID and `_struct2dict()` output, or None if the file
+      was skipped. If `instrumented`, a 2-tuple of this result and the
+      `Instrumentation.get_stats()` of reading the file.
+    """
+    instr = Instrumentation('dicom', None) if instrumented \
+        else null_instrumentation
+    d = _read_dicom(absfp, f, tags, instr)
+    if d is None:
+        res = None
+    else:
+        with instr.timer('conversion'):
+            res = d.SeriesInstanceUID, _struct2dict(d)
+    return (res, instr.get_stats()) if instrumented else res
+
+
+def _identical(a, b):
+    """Whether two converted header values are equal and of the same type"""
+    if type(a) is not type(b):
+        return False
+    if type(a) is list:
+        return len(a) == len(b) and all(map(_identical, a, b))
+    return a == b
+
+
+class FileMetadata(object):
+    """Compact store for the headers of many DICOM files
+
+    Images in a series share most of their header fields. Therefore only
+    the header of the first image in a series is kept in full. Any other
+    header is represented by the values that differ from it, and the list
+    of header fields, if it is not the same either. Field names are
+    interned, and referenced by index.
+
+    The records of all files are held until they are consumed, because
+    the series descriptions, which are reported before any file, are only
+    final once every header was read. The header of the first image of a
+    series is released together with the last record of that series.
+    """
+    def __init__(self):
+        self._key_index = {}
+        self._keys = []
+        # SeriesInstanceUID -> [field names, header of the first image,
+        # number of records not yet consumed]
+        self._series = {}
+        self._records = deque()
+
+    def __len__(self):
+        return len(self._records)
+
+    def add(self, f, uid, ddict):
+        """Add the header of a file
+
+        Parameters
+        ----------
+        f : str
+          Path of the file.
+        uid : str
+          SeriesInstanceUID of the image.
+        ddict : dict
+          `_struct2dict()` output for the image.
+        """
+        key_index = self._key_index
+        for k in ddict:
+            if k not in key_index:
+                key_index[k] = len(self._keys)
+                self._keys.append(k)
+        series = self._series.get(uid)
+        if series is None:
+            self._series[uid] = [list(ddict), ddict, 1]
+            self._records.append((f, uid, None, None))
+            return
+        base_keys, base_values, _ = series
+        series[2] += 1
+        keys = None if len(ddict) == len(base_keys) and \
+            all(a == b for a, b in zip(ddict, base_keys)) \
+            else tuple(key_index[k] for k in ddict)
+        deltas = {
+            key_index[k]: v for k, v in ddict.items()
+            if k not in base_values or not _identical(base_values[k], v)}
+        self._records.append((f, uid, keys, deltas or None))
+
+    def consume(self):
+        """Yield path and header of all files, in the order they were added
+
+        Each record is removed from the store once it was reported, and the
+        header of the first image of a series with the last one.
+
+        Yields
+        ------
+        tuple
+          Path and header (`_struct2dict()` output) of a file.
+        """
+        key_index = self._key_index
+        all_keys = self._keys
+        while self._records:
+            f, uid, keys, deltas = self._records.popleft()
+            series = self._series[uid]
+            base_keys, base_values, pending = series
+            if pending == 1:
+                del self._series[uid]
             else:
-                series, series_files = imgseries[d.SeriesInstanceUID]
-                # compare incoming with existing metadata set
-                series = {
-                    k: series[k] for k in series
-                    # only keys that exist and have values that are identical
-                    # across all images in the series
-                    if _convert_value(getattr(d, k, None)) == series[k]
-                }
-            series_files.append(f)
-            # store
-            imgseries[d.SeriesInstanceUID] = (series, series_files)
-        log_progress(
-            lgr.info,
-            'extractordicom',
-            'Finished DICOM metadata extraction from %s', self.ds
-        )
+                series[2] = pending - 1
+            if deltas is None and keys is None:
+                # no copy needed for the last record of a series
+                yield f, base_values if pending == 1 else dict(base_values)
+                continue
+            keys = base_keys if keys is None else [all_keys[i] for i in keys]
+            deltas = deltas or {}
+            yield f, {
+                k: deltas[key_index[k]] if key_index[k] in deltas
+                else base_values[k]
+                for k in keys}
 
-        dsmeta = {
-            '@context': context,
-            'Series': [info for info, files in imgseries.values()]
-        }
-        return (
-            dsmeta,
-            # yield the corresponding series description for each file
-            imgs.items() if content else []
-        )
+
+class ImageSeries(object):
+    """Description of an image series, assembled one image at a time
+
+    The description comprises all header fields with values that are
+    identical across all images in a series. Once a field is known to
+    vary, it is no longer compared for any subsequent image.
+
+    Parameters
+    ----------
+    description : dict
+      Initial description, typically all header fields of the first image.
+    files : list
+      Paths of the images described by `description`.
+    """
+    __slots__ = ('_values', '_constant', 'files')
+
+    def __init__(self, description, files):
+        self._values = description
+        self._constant = set(description)
+        self.files = files
+
+    def add(self, f, getval):
+        """Add an image to the series
+
+        Parameters
+        ----------
+        f : str
+          Path of the image file.
+        getval : callable
+          Called with a field name, must return the converted value of the
+          field in the image header, or None if there is no such field.
+        """
+        values = self._values
+        varying = [k for k in self._constant if getval(k) != values[k]]
+        if varying:
+            self._constant.difference_update(varying)
+        self.files.append(f)
+
+    @property
+    def description(self):
+        """Fields with values that are identical across all images"""
+        constant = self._constant
+        return {k: v for k, v in self._values.items() if k in constant}
+
+
+def _add_to_series(imgseries, f, uid, ddict, getval):
+    """Update the description of an image series with a new image
+
+    Parameters
+    ----------
+    imgseries : dict
+      Mapping of SeriesInstanceUIDs to `ImageSeries`.
+    f : str
+      Path of the image file.
+    uid : str
+      SeriesInstanceUID of the image.
+    ddict : dict or None
+      `_struct2dict()` output for the image. Only required for the first
+      image of a series.
+    getval : callable
+      Called with a field name, must return the converted value of the field
+      in the image header, or None if there is no such field.
+    """
+    series = imgseries.get(uid)
+    if series is None:
+        # start with a copy of the metadata of the first dicom in a series
+        description = ddict.copy()
+        # store directory containing the image series (good for sorted
+        # DICOM datasets)
+        series_dir = op.dirname(f)
+        description['SeriesDirectory'] = series_dir if series_dir else op.curdir
+        imgseries[uid] = ImageSeries(description, [f])
+    else:
+        # compare incoming with existing metadata set
+        series.add(f, getval)
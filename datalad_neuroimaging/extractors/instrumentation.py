@@ -0,0 +1,160 @@
+# emacs: -*- mode: python; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Timers and counters for the stages of a metadata extraction
+
+Instrumentation is enabled by pointing the
+``datalad.metadata.neuroimaging.report`` configuration setting to a file, to
+which a JSON report is appended for each extraction, or by registering a
+callable in `report_hooks`, which is called with each report.
+"""
+
+import json
+import logging
+import os
+import os.path as op
+from contextlib import contextmanager
+from time import perf_counter
+
+lgr = logging.getLogger('datalad.metadata.extractors.instrumentation')
+
+# callables that are called with the report dict of every instrumented
+# extraction
+report_hooks = []
+
+
+class Instrumentation(object):
+    """Accumulates the time spent in, and counts of, extraction stages
+
+    Parameters
+    ----------
+    extractor : str
+      Name of the extractor.
+    dataset : str
+      Path of the dataset metadata are extracted from.
+    path : str, optional
+      File to append the JSON report to.
+    """
+    enabled = True
+
+    def __init__(self, extractor, dataset, path=None):
+        self.extractor = extractor
+        self.dataset = dataset
+        self.path = path
+        # stage -> [seconds, calls]
+        self.timers = {}
+        self.counters = {}
+
+    @contextmanager
+    def timer(self, stage):
+        """Context manager to measure the time spent in a stage"""
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, perf_counter() - start)
+
+    def add_time(self, stage, seconds, calls=1):
+        t = self.timers.get(stage)
+        if t is None:
+            self.timers[stage] = [seconds, calls]
+        else:
+            t[0] += seconds
+            t[1] += calls
+
+    def count(self, counter, n=1):
+        self.counters[counter] = self.counters.get(counter, 0) + n
+
+    def get_stats(self):
+        """Return timers and counters, in a form that can be `merge()`'d"""
+        return self.timers, self.counters
+
+    def merge(self, stats):
+        """Add timers and counters of another instrumentation"""
+        timers, counters = stats
+        for stage, (seconds, calls) in timers.items():
+            self.add_time(stage, seconds, calls)
+        for counter, n in counters.items():
+            self.count(counter, n)
+
+    def get_report(self):
+        return {
+            'extractor': self.extractor,
+            'dataset': self.dataset,
+            'timers': {
+                stage: {'seconds': seconds, 'calls': calls}
+                for stage, (seconds, calls) in self.timers.items()},
+            'counters': dict(self.counters),
+        }
+
+    def emit(self):
+        """Report the timers and counters of the extraction"""
+        report = self.get_report()
+        lgr.debug('Extraction report: %s', report)
+        if self.path:
+            try:
+                os.makedirs(op.dirname(op.abspath(self.path)), exist_ok=True)
+                with open(self.path, 'a') as f:
+                    f.write(json.dumps(report) + '\n')
+            except OSError as e:
+                lgr.warning('Cannot write extraction report to %s: %s',
+                            self.path, e)
+        for hook in report_hooks:
+            hook(report)
+
+
+class _NullTimer(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+class NullInstrumentation(object):
+    """Stand-in with the interface of `Instrumentation`, that does nothing"""
+    enabled = False
+    _timer = _NullTimer()
+
+    def timer(self, stage):
+        return self._timer
+
+    def add_time(self, stage, seconds, calls=1):
+        pass
+
+    def count(self, counter, n=1):
+        pass
+
+    def merge(self, stats):
+        pass
+
+    def emit(self):
+        pass
+
+
+null_instrumentation = NullInstrumentation()
+
+
+def get_instrumentation(ds, extractor):
+    """Return the instrumentation for an extraction from a dataset
+
+    Parameters
+    ----------
+    ds : Dataset
+    extractor : str
+      Name of the extractor.
+
+    Returns
+    -------
+    Instrumentation or NullInstrumentation
+      The latter, if no report is requested.
+    """
+    path = ds.config.get('datalad.metadata.neuroimaging.report', None)
+    if not path and not report_hooks:
+        return null_instrumentation
+    return Instrumentation(extractor, ds.path, path=path)
@@ -8,18 +8,25 @@
 # ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
 """NIfTI metadata extractor"""
 
+import zlib
 from os.path import join as opj
 import logging
 lgr = logging.getLogger('datalad.metadata.extractors.nifti1')
-from datalad.log import log_progress
 
 from math import isnan
-import nibabel
-import numpy as np
 from datalad.dochelpers import exc_str
 from datalad_deprecated.metadata.definitions import vocabulary_id
 from datalad_deprecated.metadata.extractors.base import BaseMetadataExtractor
 
+from .instrumentation import (
+    get_instrumentation,
+    null_instrumentation,
+)
+from .utils import (
+    get_progress,
+    iter_buffered,
+)
+
 
 vocabulary = {
     'nifti1': {
@@ -53,8 +60,78 @@ unit_map = {
     'rads': ('radian', 'uo:0000123'),
 }
 
+# NiBabel, NumPy, and anything that depends on them is only set up by
+# _load_nibabel(), when metadata are actually extracted, because importing
+# them is expensive
+nibabel = None
+np = None
 # to serve as a default for when expect 0 to be consumable by np.asscalar
-_array0 = np.array(0)
+_array0 = None
+
+# by what factor to multiply by to get to 'mm'
+_spatial_unit_conversion = {
+    'unknown': 1,
+    'meter': 1000,
+    'mm': 1,
+    'micron': 0.001}
+# normalize to seconds, if possible
+_rts_unit_conversion = {
+    'msec': 0.001,
+    'micron': 0.000001}
+# temporal units that cannot be normalized to seconds
+_rts_unit_ignore = ('hz', 'ppm', 'rads')
+
+# properties of NIfTI-1 headers for the batch header reader
+_hdr_size = 348
+_single_magic = b'n+1'
+_single_vox_offset = 352
+# only single-file images are processed in batches
+_batch_exts = ('.nii', '.nii.gz')
+# extensions of all files that NiBabel would load with a NIfTI header,
+# any other file is not even opened
+_nifti_exts = tuple(
+    base + comp
+    for base in ('.nii', '.hdr', '.img')
+    for comp in ('', '.gz', '.bz2', '.zst'))
+# magic of a NIfTI-1 header, for single files and pairs, at offset 344
+_nifti1_magics = (b'n+1\x00', b'ni1\x00')
+# sizeof_hdr field of a NIfTI-2 header, in either byte order
+_nifti2_sizeof_hdr = (b'\x1c\x02\x00\x00', b'\x00\x00\x02\x1c')
+# set up by _load_nibabel()
+_hdr_dtype = None
+_data_type_codes = None
+_intent_codes = None
+_valid_datatypes = None
+_xform_codes = None
+_slice_order_codes = None
+_unit_codes = None
+_consumed_fields = ('scl_slope', 'scl_inter')
+# amount of compressed data to read at once, when inflating a header from a
+# gzip stream. A NIfTI-1 header typically compresses to a few hundred bytes
+_gzip_chunk_size = 1024
+
+
+def _load_nibabel():
+    """Import NiBabel and NumPy, and set up the header properties"""
+    global nibabel, np, _array0, _hdr_dtype, _data_type_codes, \
+        _intent_codes, _valid_datatypes, _xform_codes, _slice_order_codes, \
+        _unit_codes
+    if nibabel is not None:
+        return
+    import nibabel as nib
+    import numpy
+    np = numpy
+    _array0 = np.array(0)
+    _hdr_dtype = nib.nifti1.header_dtype
+    _data_type_codes = nib.Nifti1Header._data_type_codes
+    _intent_codes = nib.nifti1.intent_codes
+    _valid_datatypes = [
+        c for c in _data_type_codes.value_set()
+        if _data_type_codes.dtype[c].itemsize]
+    _xform_codes = list(nib.nifti1.xform_codes.value_set())
+    _slice_order_codes = list(nib.nifti1.slice_order_codes.value_set())
+    _unit_codes = list(nib.nifti1.unit_codes.value_set())
+    nibabel = nib
 
 
 class MetadataExtractor(BaseMetadataExtractor):
@@ -118,99 +195,417 @@ class MetadataExtractor(BaseMetadataExtractor):
     def get_metadata(self, dataset, content):
         if not content:
             return {}, []
-        contentmeta = []
-        log_progress(
-            lgr.info,
-            'extractornifti1',
+        _load_nibabel()
+        # number of results to extract ahead of time, while previous ones
+        # are still being processed downstream
+        buffer_size = self.ds.config.obtain(
+            'datalad.metadata.nifti1.buffer', default=0, valtype=int)
+        contentmeta = self._get_cnmeta()
+        if buffer_size > 0:
+            contentmeta = iter_buffered(contentmeta, buffer_size)
+
+        return {
+            '@context': vocabulary,
+        }, \
+            contentmeta
+
+    def _get_cnmeta(self):
+        # number of files to process together with the batch header reader,
+        # zero disables it and every header is loaded with nibabel
+        batch_size = self.ds.config.obtain(
+            'datalad.metadata.nifti1.batch-size', default=1000, valtype=int)
+        instr = get_instrumentation(self.ds, 'nifti1')
+        instr.count('files', len(self.paths))
+        candidates = [f for f in self.paths
+                      if f.lower().endswith(_nifti_exts)]
+        if len(candidates) < len(self.paths):
+            lgr.debug('Not considering %i files with a non-NIfTI extension',
+                      len(self.paths) - len(candidates))
+            instr.count('files_filtered', len(self.paths) - len(candidates))
+            instr.count('files_skipped', len(self.paths) - len(candidates))
+        progress = get_progress(self.ds, lgr.info, 'extractornifti1')
+        progress.start(
             'Start NIfTI1 metadata extraction from %s', self.ds,
-            total=len(self.paths),
+            total=len(candidates),
             label='NIfTI1 metadata extraction',
             unit=' Files',
         )
-        for f in self.paths:
-            absfp = opj(self.ds.path, f)
-            log_progress(
-                lgr.info,
-                'extractornifti1',
-                'Extract NIfTI1 metadata from %s', absfp,
-                update=1,
-                increment=True)
-            try:
-                header = nibabel.load(absfp).header
-            except Exception as e:
-                lgr.debug("NIfTI metadata extractor failed to load %s: %s",
-                          absfp, exc_str(e))
+        try:
+            for i in range(0, len(candidates), max(batch_size, 1)):
+                paths = candidates[i:i + max(batch_size, 1)]
+                absfps = [opj(self.ds.path, f) for f in paths]
+                batchmeta = self._get_batch_meta(absfps, instr) \
+                    if batch_size > 0 else [None] * len(paths)
+                for f, absfp, meta in zip(paths, absfps, batchmeta):
+                    progress.update('Extract NIfTI1 metadata from %s', absfp)
+                    if meta is False:
+                        lgr.debug('Ignoring non-NIfTI file %s', absfp)
+                        instr.count('files_filtered')
+                        instr.count('files_skipped')
+                        continue
+                    elif meta is None:
+                        # no batch processing possible, go through nibabel
+                        instr.count('files_nibabel')
+                        with instr.timer('nibabel_load'):
+                            meta = self._get_file_meta(absfp)
+                        if meta is None:
+                            instr.count('files_skipped')
+                            continue
+
+                    # Decode entries which might be bytes
+                    # TODO: consider doing that in above "metalad" logic
+                    for k, v in meta.items():
+                        if isinstance(v, bytes):
+                            meta[k] = v.decode()
+
+                    yield f, meta
+        finally:
+            # also close the progress bar, when not all results were
+            # consumed
+            progress.finish(
+                'Finished NIfTI1 metadata extraction from %s', self.ds)
+            instr.emit()
+
+    def _get_file_meta(self, absfp):
+        """Load a single header with nibabel and extract its metadata
+
+        Returns
+        -------
+        dict or None
+          None, if the file cannot be loaded or is not NIfTI-1.
+        """
+        try:
+            header = nibabel.load(absfp).header
+        except Exception as e:
+            lgr.debug("NIfTI metadata extractor failed to load %s: %s",
+                      absfp, exc_str(e))
+            return None
+        if not isinstance(header, nibabel.Nifti1Header):
+            # all we can do for now
+            lgr.debug("Ignoring non-NIfTI1 file %s", absfp)
+            return None
+
+        # blunt conversion of the entire header
+        meta = {self._key2stdkey.get(k, k):
+                [i.item() for i in v]
+                if len(v.shape)
+                # scalar
+                else v.item()
+                for k, v in header.items()
+                if k not in self._ignore}
+        # more convenient info from nibabel's support functions
+        meta.update(
+            {k: v(header) for k, v in self._extractors.items()})
+        # filter useless fields (empty strings and NaNs)
+        meta = _filter_meta(meta)
+        # a few more convenient targeted extracts from the header
+        # spatial resolution in millimeter
+        spatial_unit = header.get_xyzt_units()[0]
+        # by what factor to multiply by to get to 'mm'
+        if spatial_unit == 'unknown':
+            lgr.debug(
+                "unit of spatial resolution for '{}' unknown, assuming 'millimeter'".format(
+                    absfp))
+        spatial_unit_conversion = _spatial_unit_conversion.get(
+            spatial_unit, None)
+        if spatial_unit_conversion is None:
+            lgr.debug("unexpected spatial unit code '{}' from NiBabel".format(
+                spatial_unit))
+        # TODO does not see the light of day
+        meta['spatial_resolution(mm)'] = \
+            [(float(i * spatial_unit_conversion)) for i in header.get_zooms()[:3]]
+        # time
+        if len(header.get_zooms()) > 3:
+            # got a 4th dimension
+            rts_unit = header.get_xyzt_units()[1]
+            if rts_unit == 'unknown':
+                lgr.warn(
+                    "RTS unit '{}' unknown, assuming 'seconds'".format(
+                        absfp))
+            # normalize to seconds, if possible
+            rts_unit_conversion = _rts_unit_conversion.get(rts_unit, 1.0)
+            if rts_unit not in _rts_unit_ignore:
+                meta['temporal_spacing(s)'] = \
+                    float(header.get_zooms()[3] * rts_unit_conversion)
+        return meta
+
+    def _get_batch_meta(self, absfps, instr=null_instrumentation):
+        """Extract metadata from many NIfTI-1 headers at once
+
+        The raw headers of all files are read into a single structured array,
+        and all metadata are derived column-wise. Any header that cannot be
+        processed in exactly the same way as `_get_file_meta()` would do it
+        (unsupported file type, header that nibabel would fix or reject, etc.)
+        is left for the caller to process with nibabel. Time spent is
+        accounted in `instr`.
+
+        Returns
+        -------
+        list
+          Metadata dict for each file, None if the file needs to be
+          processed with `_get_file_meta()`, or False if the file is not a
+          NIfTI image.
+        """
+        out = [None] * len(absfps)
+        blocks = [
+            _read_header_block(p, instr) if p.endswith(_batch_exts) else None
+            for p in absfps]
+        for i, b in enumerate(blocks):
+            if b is not None and not _may_be_nifti(b):
+                # no need to have nibabel confirm that
+                out[i] = False
+        idx = [i for i, b in enumerate(blocks)
+               if b is not None and len(b) == _hdr_size and out[i] is None]
+        if not idx:
+            return out
+        with instr.timer('header_parse'):
+            buf = b''.join(blocks[i] for i in idx)
+            native = np.frombuffer(buf, dtype=_hdr_dtype)
+            swapped = np.frombuffer(buf, dtype=_hdr_dtype.newbyteorder())
+            # same endianness detection as nibabel, restricted to headers
+            # with a valid number of dimensions
+            is_native = (native['dim'][:, 0] >= 1) & (native['dim'][:, 0] <= 7)
+            is_swapped = ~is_native & \
+                (swapped['dim'][:, 0] >= 1) & (swapped['dim'][:, 0] <= 7)
+            idx = np.array(idx)
+        for hdrs, sel in ((native, is_native), (swapped, is_swapped)):
+            if not sel.any():
                 continue
-            if not isinstance(header, nibabel.Nifti1Header):
-                # all we can do for now
-                lgr.debug("Ignoring non-NIfTI1 file %s", absfp)
+            with instr.timer('conversion'):
+                metas = self._get_struct_meta(
+                    hdrs[sel], [absfps[i] for i in idx[sel]])
+            for i, meta in zip(idx[sel], metas):
+                out[i] = meta
+        return out
+
+    def _get_struct_meta(self, hdr, absfps):
+        """Derive metadata from a structured array of NIfTI-1 headers
+
+        All headers must have the same endianness.
+
+        Returns
+        -------
+        list
+          Metadata dict for each header, or None if a header is not
+          supported.
+        """
+        ndim = hdr['dim'][:, 0]
+        datatype = hdr['datatype']
+        xyzt = hdr['xyzt_units'].astype(int)
+        xyz_code = xyzt % 8
+        t_code = xyzt - xyz_code
+        slope = hdr['scl_slope']
+        inter = hdr['scl_inter']
+        with np.errstate(invalid='ignore', over='ignore'):
+            used_dims = np.arange(8)[None, :] <= ndim[:, None]
+            # qform is used when there is no sform, it must be a valid rotation
+            quat_norm = sum(
+                hdr[k].astype(np.float64) ** 2
+                for k in ('quatern_b', 'quatern_c', 'quatern_d'))
+            valid = (
+                (hdr['sizeof_hdr'] == _hdr_size)
+                & (hdr['magic'] == _single_magic)
+                & np.all((hdr['dim'] >= 1) | ~used_dims, axis=1)
+                # freesurfer ico7 hack would modify the data shape
+                & (hdr['dim'][:, 1] != 27307)
+                & np.isin(datatype, _valid_datatypes)
+                & (hdr['bitpix'] == _datatype_bitpix(datatype))
+                & ~np.any(hdr['pixdim'][:, 1:4] <= 0, axis=1)
+                & np.isin(hdr['pixdim'][:, 0], (-1, 1))
+                & ((hdr['vox_offset'] == 0)
+                   | (hdr['vox_offset'] >= _single_vox_offset))
+                & np.isin(hdr['qform_code'], _xform_codes)
+                & np.isin(hdr['sform_code'], _xform_codes)
+                & np.isin(hdr['slice_code'], _slice_order_codes)
+                & np.isin(xyz_code, _unit_codes)
+                & np.isin(t_code, _unit_codes)
+                # nibabel refuses a valid slope with an invalid intercept
+                & ~((slope != 0) & np.isfinite(slope) & ~np.isfinite(inter))
+                & ((hdr['sform_code'] != 0) | (hdr['qform_code'] == 0)
+                   | (quat_norm <= 1.0))
+            )
+        if not valid.any():
+            return [None] * len(hdr)
+        sel = np.flatnonzero(valid)
+        hdr = hdr[sel]
+        ndim = ndim[sel]
+        xyz_code = xyz_code[sel]
+        t_code = t_code[sel]
+        # blunt conversion of the entire header, column by column
+        columns = {
+            self._key2stdkey.get(k, k): hdr[k].tolist()
+            for k in hdr.dtype.names
+            if k not in self._ignore}
+        # nibabel resets consumable values of a loaded header (the data
+        # offset, and the scaling that ends up as NaN and gets filtered)
+        columns['vox_offset'] = [0.0] * len(hdr)
+        for k in _consumed_fields:
+            columns.pop(k, None)
+        # same conveniences as nibabel's support functions
+        dim_info = hdr['dim_info'].astype(int)
+        columns.update({
+            'datatype': _map_codes(
+                hdr['datatype'],
+                lambda c: _data_type_codes.dtype[c].name),
+            'intent': _map_codes(
+                hdr['intent_code'],
+                lambda c: _intent_codes.label[c] if c in _intent_codes
+                else 'unknown code {}'.format(c)),
+            'freq_axis': _map_codes(
+                dim_info & 3, lambda c: c - 1 if c else None),
+            'phase_axis': _map_codes(
+                (dim_info >> 2) & 3, lambda c: c - 1 if c else None),
+            'slice_axis': _map_codes(
+                (dim_info >> 4) & 3, lambda c: c - 1 if c else None),
+            'xyz_unit': _map_codes(xyz_code, _format_unit),
+            't_unit': _map_codes(t_code, _format_unit),
+            'qform_code': _map_codes(
+                hdr['qform_code'], lambda c: nibabel.nifti1.xform_codes.label[c]),
+            'sform_code': _map_codes(
+                hdr['sform_code'], lambda c: nibabel.nifti1.xform_codes.label[c]),
+            'slice_order': _map_codes(
+                hdr['slice_code'],
+                lambda c: nibabel.nifti1.slice_order_codes.label[c]),
+        })
+        xyz_label = _map_codes(xyz_code, lambda c: nibabel.nifti1.unit_codes.label[c])
+        t_label = _map_codes(t_code, lambda c: nibabel.nifti1.unit_codes.label[c])
+        # spatial resolution in millimeter, the arithmetic matches the one of
+        # the scalar implementation exactly
+        pixdim = hdr['pixdim']
+        resolution = [None] * len(hdr)
+        temporal = [None] * len(hdr)
+        for unit in set(xyz_label):
+            rows = np.flatnonzero(np.array(xyz_label) == unit)
+            res = _scale(pixdim[rows, 1:4], _spatial_unit_conversion[unit])
+            for r, v in zip(rows, res.tolist()):
+                resolution[r] = v[:min(ndim[r], 3)]
+        for unit in set(t_label):
+            if unit in _rts_unit_ignore:
                 continue
+            rows = np.flatnonzero((np.array(t_label) == unit) & (ndim > 3))
+            res = _scale(pixdim[rows, 4], _rts_unit_conversion.get(unit, 1.0))
+            for r, v in zip(rows, res.tolist()):
+                temporal[r] = v
 
-            # blunt conversion of the entire header
-            meta = {self._key2stdkey.get(k, k):
-                    [i.item() for i in v]
-                    if len(v.shape)
-                    # scalar
-                    else v.item()
-                    for k, v in header.items()
-                    if k not in self._ignore}
-            # more convenient info from nibabel's support functions
-            meta.update(
-                {k: v(header) for k, v in self._extractors.items()})
-            # filter useless fields (empty strings and NaNs)
-            meta = {k: v for k, v in meta.items()
-                    if not (isinstance(v, float) and isnan(v)) and
-                    not (hasattr(v, '__len__') and not len(v))}
-            # a few more convenient targeted extracts from the header
-            # spatial resolution in millimeter
-            spatial_unit = header.get_xyzt_units()[0]
-            # by what factor to multiply by to get to 'mm'
-            if spatial_unit == 'unknown':
+        metas = [None] * len(valid)
+        keys = list(columns)
+        for r, i in enumerate(sel):
+            absfp = absfps[i]
+            meta = _filter_meta({k: columns[k][r] for k in keys})
+            if xyz_label[r] == 'unknown':
                 lgr.debug(
                     "unit of spatial resolution for '{}' unknown, assuming 'millimeter'".format(
                         absfp))
-            spatial_unit_conversion = {
-                'unknown': 1,
-                'meter': 1000,
-                'mm': 1,
-                'micron': 0.001}.get(spatial_unit, None)
-            if spatial_unit_conversion is None:
-                lgr.debug("unexpected spatial unit code '{}' from NiBabel".format(
-                    spatial_unit))
-            # TODO does not see the light of day
-            meta['spatial_resolution(mm)'] = \
-                [(float(i * spatial_unit_conversion)) for i in header.get_zooms()[:3]]
-            # time
-            if len(header.get_zooms()) > 3:
-                # got a 4th dimension
-                rts_unit = header.get_xyzt_units()[1]
-                if rts_unit == 'unknown':
+            meta['spatial_resolution(mm)'] = resolution[r]
+            if ndim[r] > 3:
+                if t_label[r] == 'unknown':
                     lgr.warn(
                         "RTS unit '{}' unknown, assuming 'seconds'".format(
                             absfp))
-                # normalize to seconds, if possible
-                rts_unit_conversion = {
-                    'msec': 0.001,
-                    'micron': 0.000001}.get(rts_unit, 1.0)
-                if rts_unit not in ('hz', 'ppm', 'rads'):
-                    meta['temporal_spacing(s)'] = \
-                        float(header.get_zooms()[3] * rts_unit_conversion)
-
-            contentmeta.append((f, meta))
-
-            # Decode entries which might be bytes
-            # TODO: consider doing that in above "metalad" logic
-            for k, v in meta.items():
-                if isinstance(v, bytes):
-                    meta[k] = v.decode()
-
-        log_progress(
-            lgr.info,
-            'extractornifti1',
-            'Finished NIfTI1 metadata extraction from %s', self.ds
-        )
+                if temporal[r] is not None:
+                    meta['temporal_spacing(s)'] = temporal[r]
+            metas[i] = meta
+        return metas
 
-        return {
-            '@context': vocabulary,
-        }, \
-            contentmeta
+
+def _filter_meta(meta):
+    """Filter useless fields (empty strings and NaNs)"""
+    return {k: v for k, v in meta.items()
+            if not (isinstance(v, float) and isnan(v)) and
+            not (hasattr(v, '__len__') and not len(v))}
+
+
+def _format_unit(code):
+    unit = nibabel.nifti1.unit_codes.label[code]
+    return '{} ({})'.format(*unit_map[unit]) if unit in unit_map else ''
+
+
+def _map_codes(codes, fx):
+    """Map an array of codes to values, computing each value only once"""
+    lookup = {c: fx(c) for c in np.unique(codes).tolist()}
+    return [lookup[c] for c in codes.tolist()]
+
+
+def _scale(values, factor):
+    """Multiply float32 header values by a Python scalar
+
+    Performs the computation in the same precision as a multiplication of a
+    NumPy scalar with `factor`, to match the results of the per-file
+    implementation regardless of NumPy's type promotion rules.
+    """
+    rtype = (np.float32(1) * factor).dtype
+    return values.astype(rtype) * np.asarray(factor, dtype=rtype)
+
+
+def _datatype_bitpix(datatype):
+    return np.array(
+        _map_codes(datatype,
+                   lambda c: _data_type_codes.dtype[c].itemsize * 8
+                   if c in _valid_datatypes else -1),
+        dtype=int).reshape(datatype.shape)
+
+
+def _may_be_nifti(block):
+    """Whether NiBabel could load a file with a NIfTI header as an image
+
+    Parameters
+    ----------
+    block : bytes
+      Leading bytes of the (uncompressed) file, at least the size of a
+      NIfTI-1 header for a NIfTI-1 image.
+    """
+    return block[_hdr_size - 4:_hdr_size] in _nifti1_magics \
+        or block[:4] in _nifti2_sizeof_hdr
+
+
+def _read_header_block(path, instr=null_instrumentation):
+    """Read the raw (uncompressed) bytes of a NIfTI-1 header from a file
+
+    For gzip-compressed files only as much of the compressed stream is read
+    and inflated as is needed for the header, regardless of the size of the
+    image data. Time spent and bytes read are accounted in `instr`.
+
+    Returns
+    -------
+    bytes or None
+      None, if the file cannot be read.
+    """
+    try:
+        # unbuffered, to avoid reading ahead into the image data
+        with instr.timer('file_open'):
+            f = open(path, 'rb', buffering=0)
+        with f, instr.timer('header_read'):
+            if path.endswith('.gz'):
+                head = _inflate_head(f, _hdr_size)
+            else:
+                head = f.read(_hdr_size)
+            instr.count('bytes_read', f.tell())
+            return head
+    except (OSError, zlib.error) as e:
+        lgr.debug("Cannot read NIfTI header from %s: %s", path, exc_str(e))
+        return None
+
+
+def _inflate_head(f, size):
+    """Decompress the first `size` bytes of a gzip stream
+
+    Parameters
+    ----------
+    f : file
+      Binary file object, positioned at the start of the gzip stream.
+    size : int
+
+    Returns
+    -------
+    bytes
+      Can be shorter than `size`, if the stream ends early.
+    """
+    # 16 + MAX_WBITS: expect a gzip header
+    inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    head = b''
+    while len(head) < size and not inflater.eof:
+        chunk = f.read(_gzip_chunk_size)
+        if not chunk:
+            break
+        head += inflater.decompress(chunk, size - len(head))
+    return head
@@ -8,14 +8,17 @@
 # ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
 """Test BIDS metadata extractor """
 import json
+import os
 from math import isnan
 from os.path import join as opj
+from unittest.mock import patch
 
 from datalad.api import Dataset
 from datalad.support.external_versions import external_versions
 from datalad.tests.utils_pytest import (
     assert_equal,
     assert_in,
+    assert_not_equal,
     known_failure_osx,
     known_failure_windows,
     skip_if_no_module,
@@ -25,6 +28,7 @@ from datalad.tests.utils_pytest import (
 skip_if_no_module('bids')
 
 from datalad_neuroimaging.extractors.bids import MetadataExtractor
+from datalad_neuroimaging.extractors.cache import get_cache_dir
 
 bids_template = {
     '.datalad': {
@@ -165,3 +169,34 @@ def test_get_metadata_with_README(path=None):
   "description": "A very detailed\\ndescription с юникодом",
   "name": "test"
 }""")
+
+
+@known_failure_windows
+@known_failure_osx
+@with_tree(tree=bids_template)
+def test_layout_cache(path=None):
+    ds = Dataset(path).create(force=True)
+    ds.config.set('datalad.metadata.bids.layout-cache', 'yes', scope='local')
+    paths = [opj('sub-01', 'func', 'sub-01_task-some_bold.nii.gz')]
+    # no index for a dataset with uncommitted changes
+    res = MetadataExtractor(ds, paths).get_metadata(True, True)
+    cmeta = list(res[1])
+    index_dir = opj(get_cache_dir(ds), 'bids-layout')
+    assert not os.path.exists(index_dir)
+    ds.save()
+    MetadataExtractor(ds, paths).get_metadata(True, True)
+    indexes = os.listdir(index_dir)
+    assert_equal(len(indexes), 1)
+    # the index is reused, no file is indexed again
+    with patch('bids.layout.index.BIDSLayoutIndexer.__call__',
+               side_effect=RuntimeError('reindexed')):
+        res = MetadataExtractor(ds, paths).get_metadata(True, True)
+        assert_equal(res[0], MetadataExtractor(ds, paths).get_metadata(
+            True, False)[0])
+        assert_equal(list(res[1]), cmeta)
+    # any change to the dataset leads to a new index
+    (ds.pathobj / 'sub-03' / 'func' / 'sub-03_task-other_bold.nii.gz').unlink()
+    ds.save()
+    MetadataExtractor(ds, paths).get_metadata(True, False)
+    assert_not_equal(os.listdir(index_dir), indexes)
+    assert_equal(len(os.listdir(index_dir)), 1)
@@ -10,15 +10,22 @@
 import json
 from math import isnan
 from os.path import join as opj
+from pathlib import Path
+from unittest.mock import patch
 
 from datalad.api import Dataset
+from datalad.api import clone as dl_clone
 from datalad.support.external_versions import external_versions
 from datalad.tests.utils_pytest import (
     assert_equal,
     assert_in,
+    eq_,
+    assert_raises,
+    assert_result_count,
     known_failure_osx,
     known_failure_windows,
     skip_if_no_module,
+    with_tempfile,
     with_tree,
 )
 
@@ -26,7 +33,14 @@ skip_if_no_module('bids')
 
 from unittest import TestCase
 
-from datalad_neuroimaging.extractors.bids_dataset import BIDSmeta
+from datalad_neuroimaging.extractors.bids import \
+    MetadataExtractor as BIDSExtractor
+from datalad_neuroimaging.extractors.bids_dataset import (
+    BIDSDatasetExtractor,
+    BIDSmeta,
+    _find_bids_root,
+)
+from datalad_neuroimaging.extractors.cache import get_cache_dir
 
 TestCase.maxDiff = None
 
@@ -161,3 +175,97 @@ def sort_lists_in_dict(data_dict):
             data_dict[key].sort()
         if isinstance(value, dict):
             sort_lists_in_dict(data_dict[key])
+
+
+@with_tree(tree={
+    '.hidden': {'dataset_description.json': '{}'},
+    'derivatives': {'fmriprep': {'dataset_description.json': '{}'}},
+    'sub-01': {'dataset_description.json': '{}'},
+    'data': {
+        'raw': {'dataset_description.json': '{}'},
+        'other': {'deep': {'dataset_description.json': '{}'}},
+        'sub-02': {'dataset_description.json': '{}'},
+    },
+})
+def test_find_bids_root(path=None):
+    ds = Dataset(path).create(force=True)
+    root = Path(path)
+    # the shallowest match outside of hidden and deferred subtrees
+    assert_equal(_find_bids_root(path), root / 'data' / 'raw')
+    (root / 'data' / 'raw' / 'dataset_description.json').unlink()
+    assert_equal(_find_bids_root(path), root / 'data' / 'other' / 'deep')
+    (root / 'data' / 'other' / 'deep' / 'dataset_description.json').unlink()
+    # deferred subtrees are considered last, still shallowest first
+    assert_equal(_find_bids_root(path), root / 'sub-01')
+    # the top-level directory wins
+    (root / 'dataset_description.json').write_text('{}')
+    assert_equal(_find_bids_root(path), root)
+    # matches in the git index and the work tree are ranked alike
+    ds.save('derivatives')
+    assert_equal(_find_bids_root(path, ds.repo), root)
+    (root / 'dataset_description.json').unlink()
+    assert_equal(_find_bids_root(path, ds.repo), root / 'sub-01')
+    (root / 'sub-01' / 'dataset_description.json').unlink()
+    # at the same rank, the first by name
+    assert_equal(_find_bids_root(path, ds.repo), root / 'data' / 'sub-02')
+    (root / 'data' / 'sub-02' / 'dataset_description.json').unlink()
+    assert_equal(_find_bids_root(path, ds.repo),
+                 root / 'derivatives' / 'fmriprep')
+    (root / 'derivatives' / 'fmriprep' / 'dataset_description.json').unlink()
+    # tracked, but gone from the work tree
+    assert_equal(_find_bids_root(path, ds.repo),
+                 root / 'derivatives' / 'fmriprep')
+    assert_raises(FileNotFoundError, _find_bids_root, path)
+
+
+@known_failure_windows
+@with_tree(tree=bids_template)
+@with_tempfile
+def test_get_required_content(path=None, clone_path=None):
+    Dataset(path).create(force=True).save()
+    clone = dl_clone(source=path, path=clone_path)
+    for f in ('dataset_description.json', 'README.md'):
+        assert not (clone.pathobj / f).exists()
+    calls = []
+    get = Dataset.get
+
+    def _get(self, *args, **kwargs):
+        calls.append(args)
+        return get(self, *args, **kwargs)
+
+    with patch.object(Dataset, 'get', _get):
+        res = list(BIDSDatasetExtractor(clone, None).get_required_content())
+    # all content is retrieved with a single call
+    eq_(len(calls), 1)
+    assert_result_count(res, 1)
+    assert_result_count(res, 1, status='ok')
+    for f in ('dataset_description.json', 'README.md'):
+        assert (clone.pathobj / f).exists()
+    # no more attempts for content that is present
+    with patch.object(Dataset, 'get', _get):
+        BIDSmeta(clone)._get_bids_readme()
+    eq_(len(calls), 1)
+
+    (clone.pathobj / 'dataset_description.json').unlink()
+    res = list(BIDSDatasetExtractor(clone, None).get_required_content())
+    assert_result_count(res, 1, status='impossible')
+
+
+@known_failure_windows
+@known_failure_osx
+@with_tree(tree={
+    'study': {k: v for k, v in bids_template.items() if k != '.datalad'}})
+def test_layout_cache_subdir(path=None):
+    ds = Dataset(path).create(force=True)
+    ds.config.set('datalad.metadata.bids.layout-cache', 'yes', scope='local')
+    ds.save()
+    dsmeta = BIDSmeta(ds).get_metadata()
+    index_dir = Path(get_cache_dir(ds)) / 'bids-layout' / ds.repo.get_hexsha()
+    eq_(len(list(index_dir.iterdir())), 1)
+    # the bids extractor needs the BIDS root at the top of the dataset,
+    # but even failing it must leave the index of the other root alone
+    assert_raises(
+        ValueError, BIDSExtractor(ds, []).get_metadata, True, False)
+    with patch('bids.layout.index.BIDSLayoutIndexer.__call__',
+               side_effect=RuntimeError('reindexed')):
+        eq_(BIDSmeta(ds).get_metadata(), dsmeta)
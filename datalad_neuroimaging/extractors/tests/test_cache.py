@@ -0,0 +1,43 @@
+# emacs: -*- mode: python-mode; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil; coding: utf-8 -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Test persistent extractor caches"""
+
+from os.path import join as opj
+
+from datalad.tests.utils_pytest import (
+    eq_,
+    with_tempfile,
+)
+
+from datalad_neuroimaging.extractors.cache import MetadataCache
+
+
+@with_tempfile(mkdir=True)
+def test_metadata_cache(path=None):
+    dbpath = opj(path, 'sub', 'cache.sqlite')
+    with MetadataCache(dbpath, 'v1', maxsize=90) as cache:
+        eq_(cache.get('a', 'missing'), 'missing')
+        cache.set('a', {'some': [1, 2.5, 'three']})
+        cache.set('b', None)
+        # not serializable, silently not cached
+        cache.set('c', object())
+        eq_(cache.get('a'), {'some': [1, 2.5, 'three']})
+        eq_(cache.get('b', 'missing'), None)
+        eq_((cache.hits, cache.misses), (2, 1))
+    with MetadataCache(dbpath, 'v1', maxsize=90) as cache:
+        eq_(cache.keys(), {'a', 'b'})
+        # exceed the size limit
+        cache.set('d', 'x' * 60)
+        cache.get('a')
+    with MetadataCache(dbpath, 'v1', maxsize=90) as cache:
+        # least recently used record is gone
+        eq_(cache.keys(), {'a', 'd'})
+    # a different profile invalidates all records
+    with MetadataCache(dbpath, 'v2', maxsize=90) as cache:
+        eq_(cache.keys(), set())
@@ -16,8 +16,10 @@ try:
 except ImportError:
     raise SkipTest
 
+import os
 import os.path as op
 from shutil import copy
+from unittest.mock import patch
 
 from datalad.api import Dataset
 from datalad.tests.utils_pytest import (
@@ -102,3 +104,200 @@ def test_dicom(path=None):
         # the auto-uniquified bits are gone but the Series description stays
         assert_not_in("datalad_unique_content_properties", res[0]['metadata'])
     eq_(dsmeta['Series'], [meta])
+
+
+def _make_dicom_series(path):
+    """Place a few variants of the test DICOM file into `path`
+
+    Yields two image series with two and three images, respectively,
+    and a file that is not DICOM at all.
+    """
+    import pydicom
+    src = op.join(
+        op.dirname(op.dirname(op.dirname(__file__))),
+        'tests', 'data', 'files', 'dicom.dcm')
+    paths = []
+    for series in range(2):
+        os.makedirs(op.join(path, 'series{}'.format(series)))
+        for image in range(2 + series):
+            d = pydicom.dcmread(src)
+            d.InstanceNumber = image + 1
+            d.SliceLocation = float(image)
+            if series:
+                d.SeriesInstanceUID = d.SeriesInstanceUID + '.1'
+            fpath = op.join('series{}'.format(series), 'im{}.dcm'.format(image))
+            d.save_as(op.join(path, fpath))
+            paths.append(fpath)
+    with open(op.join(path, 'notdicom.txt'), 'w') as f:
+        f.write('nothing to see here')
+    paths.append('notdicom.txt')
+    return paths
+
+
+@with_tempfile(mkdir=True)
+def test_dicom_parallel(path=None):
+    paths = _make_dicom_series(path)
+    ds = Dataset(path).create(force=True)
+    serial = DicomExtractor(ds, paths).get_metadata(True, True)
+    ds.config.set('datalad.metadata.dicom.jobs', '2', scope='local')
+    parallel = DicomExtractor(ds, paths).get_metadata(True, True)
+    eq_(len(serial[0]['Series']), 2)
+    eq_(serial[0], parallel[0])
+    eq_(list(serial[1]), list(parallel[1]))
+    # varying properties are not part of the series description
+    assert_not_in('InstanceNumber', serial[0]['Series'][0])
+    assert_in('SeriesDate', serial[0]['Series'][1])
+
+
+@with_tempfile(mkdir=True)
+def test_dicom_cache(path=None):
+    paths = _make_dicom_series(path)
+    ds = Dataset(path).create(force=True)
+    ds.save()
+    ds.config.set('datalad.metadata.dicom.cache', 'true', scope='local')
+    target = DicomExtractor(ds, paths).get_metadata(True, True)
+    # all headers come from the cache now
+    with patch('pydicom.dcmread',
+               side_effect=RuntimeError('must not be called')):
+        cached = DicomExtractor(ds, paths).get_metadata(True, True)
+    eq_(target[0], cached[0])
+    eq_(list(target[1]), list(cached[1]))
+    res = ds.purge_extractor_cache()
+    assert_result_count(res, 1, status='ok')
+    assert_status('notneeded', ds.purge_extractor_cache())
+
+
+@with_tempfile(mkdir=True)
+def test_dicom_tag_allowlist(path=None):
+    paths = _make_dicom_series(path)
+    ds = Dataset(path).create(force=True)
+    full = DicomExtractor(ds, paths).get_metadata(True, True)
+    ds.config.set(
+        'datalad.metadata.dicom.tags', 'SeriesDate, InstanceNumber',
+        scope='local')
+    ds.config.add('datalad.metadata.dicom.tags', 'bogus', scope='local')
+    partial = DicomExtractor(ds, paths).get_metadata(True, True)
+    eq_(len(partial[0]['Series']), 2)
+    for (f, fullmeta), (pf, meta) in zip(full[1], partial[1]):
+        eq_(f, pf)
+        eq_(sorted(meta),
+            sorted(k for k in ('InstanceNumber', 'SeriesDate',
+                               'SeriesInstanceUID', 'SpecificCharacterSet')
+                   if k in fullmeta))
+        eq_(meta, {k: fullmeta[k] for k in meta})
+
+
+@with_tempfile(mkdir=True)
+def test_dicom_incremental(path=None):
+    from datalad_neuroimaging.extractors import dicom
+    paths = _make_dicom_series(path)
+    ds = Dataset(path).create(force=True)
+    ds.save()
+    ds.config.set('datalad.metadata.dicom.incremental', 'true', scope='local')
+    read = []
+    read_dicom = dicom._read_dicom
+
+    def _read(absfp, f, *args):
+        read.append(f)
+        return read_dicom(absfp, f, *args)
+
+    def _check(paths, target_read):
+        del read[:]
+        with patch.object(dicom, '_read_dicom', _read):
+            meta = DicomExtractor(ds, paths).get_metadata(True, False)[0]
+        eq_(sorted(read), sorted(target_read))
+        ds.config.set('datalad.metadata.dicom.incremental', 'false',
+                      scope='local')
+        eq_(meta, DicomExtractor(ds, paths).get_metadata(True, False)[0])
+        ds.config.set('datalad.metadata.dicom.incremental', 'true',
+                      scope='local')
+        return meta
+
+    # the text file is not even considered
+    _check(paths, [f for f in paths if f != 'notdicom.txt'])
+    # nothing changed, nothing to read
+    _check(paths, [])
+    # a new series, and a new image for an existing series
+    import pydicom
+    os.makedirs(op.join(path, 'series2'))
+    new_paths = []
+    for src, dst, uid in (
+            ('series0/im0.dcm', 'series2/im0.dcm', '.2'),
+            ('series0/im1.dcm', 'series2/im1.dcm', '.2'),
+            ('series1/im0.dcm', 'series1/im3.dcm', '')):
+        d = pydicom.dcmread(op.join(path, src))
+        d.SeriesInstanceUID = d.SeriesInstanceUID + uid
+        d.InstanceNumber = 4
+        d.save_as(op.join(path, dst))
+        new_paths.append(op.join(*dst.split('/')))
+    ds.save()
+    paths = sorted(set(paths + new_paths))
+    meta = _check(paths, new_paths)
+    eq_(len(meta['Series']), 3)
+    # a modified image moves to another series
+    fpath = op.join(path, 'series2', 'im1.dcm')
+    d = pydicom.dcmread(fpath)
+    d.SeriesInstanceUID = d.SeriesInstanceUID + '3'
+    os.unlink(fpath)
+    d.save_as(fpath)
+    ds.save()
+    meta = _check(paths, [op.join('series2', 'im0.dcm'),
+                          op.join('series2', 'im1.dcm')])
+    eq_(len(meta['Series']), 4)
+    # a removed image requires the series to be assembled again
+    ds.remove(op.join('series1', 'im0.dcm'), reckless='kill')
+    paths.remove(op.join('series1', 'im0.dcm'))
+    _check(paths, [f for f in paths if f.startswith('series1')])
+    # a series without any images is gone
+    ds.remove('series1', reckless='kill')
+    paths = [f for f in paths if not f.startswith('series1')]
+    meta = _check(paths, [])
+    eq_(len(meta['Series']), 3)
+
+
+def test_image_series():
+    from datalad_neuroimaging.extractors.dicom import ImageSeries
+    series = ImageSeries({'a': 1, 'b': 2, 'c': [3]}, ['f1'])
+    queried = []
+
+    def _getval(values):
+        def getval(k):
+            queried.append(k)
+            return values.get(k)
+        return getval
+
+    series.add('f2', _getval({'a': 1, 'b': 5, 'c': [3]}))
+    eq_(series.description, {'a': 1, 'c': [3]})
+    del queried[:]
+    series.add('f3', _getval({'a': 1, 'b': 2}))
+    # a varying field is not compared again
+    eq_(sorted(queried), ['a', 'c'])
+    eq_(series.description, {'a': 1})
+    eq_(series.files, ['f1', 'f2', 'f3'])
+
+
+def test_file_metadata():
+    from datalad_neuroimaging.extractors.dicom import FileMetadata
+    headers = [
+        ('f1', 'a', {'A': 1, 'B': 'x', 'C': [1.0, 2.0]}),
+        ('f2', 'b', {'A': 1, 'D': float('nan')}),
+        ('f3', 'a', {'A': 2, 'B': 'x', 'C': [1.0, 2.0]}),
+        ('f4', 'a', {'B': 'x', 'A': 1.0, 'C': [1, 2.0]}),
+        ('f5', 'a', {'A': 1, 'B': 'x', 'C': [1.0, 2.0], 'E': None}),
+        ('f6', 'b', {'A': 1, 'D': float('nan')}),
+    ]
+    store = FileMetadata()
+    for f, uid, ddict in headers:
+        store.add(f, uid, ddict)
+    eq_(len(store), 6)
+    it = store.consume()
+    res = [next(it) for i in range(5)]
+    # the first header of a series is released with its last record
+    eq_(list(store._series), ['b'])
+    res.extend(it)
+    eq_(len(store), 0)
+    eq_(store._series, {})
+    eq_([f for f, ddict in res], [f for f, uid, ddict in headers])
+    for (f, ddict), (hf, uid, hddict) in zip(res, headers):
+        # same fields, same order, same values and types
+        eq_(repr(ddict), repr(hddict))
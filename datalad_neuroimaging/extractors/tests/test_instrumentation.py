@@ -0,0 +1,115 @@
+# emacs: -*- mode: python-mode; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil; coding: utf-8 -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Test extractor instrumentation"""
+
+import json
+import os.path as op
+from unittest.mock import patch
+
+from datalad.api import Dataset
+from datalad.tests.utils_pytest import (
+    assert_false,
+    assert_greater,
+    assert_in,
+    assert_raises,
+    assert_true,
+    eq_,
+    with_tempfile,
+)
+
+from datalad_neuroimaging.extractors import instrumentation
+from datalad_neuroimaging.extractors.instrumentation import (
+    Instrumentation,
+    get_instrumentation,
+    null_instrumentation,
+)
+
+from .test_dicom import _make_dicom_series
+from .test_nifti1 import _make_nifti_files
+
+
+def test_instrumentation():
+    instr = Instrumentation('some', '/some/path')
+    with instr.timer('stage'):
+        pass
+    with assert_raises(ValueError):
+        with instr.timer('stage'):
+            raise ValueError
+    instr.count('files')
+    instr.count('files', 2)
+    other = Instrumentation('some', None)
+    other.add_time('stage', 1.0, 3)
+    other.add_time('other', 2.0)
+    other.count('files')
+    instr.merge(other.get_stats())
+    report = instr.get_report()
+    eq_(report['extractor'], 'some')
+    eq_(report['dataset'], '/some/path')
+    eq_(report['counters'], {'files': 4})
+    eq_(report['timers']['stage']['calls'], 5)
+    assert_greater(report['timers']['stage']['seconds'], 1.0)
+    eq_(report['timers']['other'], {'seconds': 2.0, 'calls': 1})
+    # the stand-in does not record anything
+    with null_instrumentation.timer('stage'):
+        null_instrumentation.count('files')
+    assert_false(null_instrumentation.enabled)
+
+
+@with_tempfile(mkdir=True)
+def test_instrumentation_report(path=None):
+    from datalad_neuroimaging.extractors.dicom import \
+        MetadataExtractor as DicomExtractor
+    from datalad_neuroimaging.extractors.nifti1 import \
+        MetadataExtractor as NiftiExtractor
+
+    ds = Dataset(path).create()
+    dicom_files = _make_dicom_series(path)
+    nifti_files = _make_nifti_files(path)
+    # off by default
+    assert_false(get_instrumentation(ds, 'dicom').enabled)
+
+    reports = []
+    with patch.object(instrumentation, 'report_hooks', [reports.append]):
+        assert_true(get_instrumentation(ds, 'dicom').enabled)
+        for jobs in ('1', '2'):
+            ds.config.set('datalad.metadata.dicom.jobs', jobs, scope='local')
+            DicomExtractor(ds, dicom_files).get_metadata(True, True)
+    for report in reports:
+        eq_(report['extractor'], 'dicom')
+        eq_(report['dataset'], ds.path)
+        eq_(report['counters']['files'], 6)
+        eq_(report['counters']['files_skipped'], 1)
+        # notdicom.txt is not even opened
+        eq_(report['counters']['files_filtered'], 1)
+        assert_greater(report['counters']['bytes_read'], 0)
+        eq_(report['timers']['file_open']['calls'], 5)
+        eq_(report['timers']['series_merge']['calls'], 5)
+        assert_in('header_parse', report['timers'])
+        assert_in('conversion', report['timers'])
+    # workers account for the same amount of data
+    eq_(reports[0]['counters'], reports[1]['counters'])
+
+    report_path = op.join(path, 'logs', 'report.jsonl')
+    ds.config.set('datalad.metadata.neuroimaging.report', report_path,
+                  scope='local')
+    for _ in range(2):
+        list(NiftiExtractor(ds, nifti_files + dicom_files).get_metadata(
+            True, True)[1])
+    with open(report_path) as f:
+        reports = [json.loads(line) for line in f]
+    eq_(len(reports), 2)
+    report = reports[0]
+    eq_(report['extractor'], 'nifti1')
+    eq_(report['counters']['files'], len(nifti_files) + len(dicom_files))
+    # DICOM files by extension, and garbage.nii by its content
+    eq_(report['counters']['files_filtered'], len(dicom_files) + 1)
+    # and badscaling.nii, which nibabel refuses to load
+    eq_(report['counters']['files_skipped'], len(dicom_files) + 2)
+    assert_in('header_read', report['timers'])
+    assert_in('nibabel_load', report['timers'])
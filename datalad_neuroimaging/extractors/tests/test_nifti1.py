@@ -83,3 +83,78 @@ def test_nifti(path=None):
         eq_(meta[k], v)
 
     assert_in('@context', meta)
+
+
+def _make_nifti_files(path):
+    import numpy as np
+    files = []
+    affine = np.diag([2.0, 2.0, 3.0, 1.0])
+
+    def _save(name, img, **hdr):
+        for k, v in hdr.items():
+            img.header[k] = v
+        fname = opj(path, name)
+        nibabel.save(img, fname)
+        files.append(name)
+        return fname
+
+    _save('plain.nii',
+          nibabel.Nifti1Image(np.zeros((2, 3, 4), dtype=np.int16), affine))
+    img = nibabel.Nifti1Image(np.zeros((2, 3, 4, 5), dtype=np.float32), affine)
+    img.header.set_xyzt_units('micron', 'msec')
+    img.header.set_dim_info(0, 1, 2)
+    img.header.set_intent('t test', (10,))
+    _save('func.nii.gz', img, descrip=b'some description',
+          slice_code=3, slice_end=3, qform_code=0)
+    img = nibabel.Nifti1Image(np.zeros((2, 3, 4, 5), dtype=np.uint8), affine)
+    img.header.set_xyzt_units('meter', 'hz')
+    _save('hz.nii', img)
+    # big-endian header
+    img = nibabel.Nifti1Image(np.zeros((2, 3), dtype='>i4'), np.eye(4))
+    _save('bigendian.nii', img)
+    # header with an odd scaling, nibabel refuses to load it
+    img = nibabel.Nifti1Image(np.zeros((2, 3, 4), dtype=np.int16), affine)
+    _save('badscaling.nii', img, scl_slope=2.0, scl_inter=np.inf)
+    # header with a wrong magic, nibabel fixes it on load
+    img = nibabel.Nifti1Image(np.zeros((2, 3, 4), dtype=np.int16), affine)
+    fname = _save('badmagic.nii', img)
+    with open(fname, 'r+b') as f:
+        f.seek(344)
+        f.write(b'ni1\x00')
+    # NIfTI pair
+    _save('pair.img',
+          nibabel.Nifti1Pair(np.zeros((2, 3, 4), dtype=np.int16), affine))
+    # not a NIfTI file at all
+    with open(opj(path, 'garbage.nii'), 'wb') as f:
+        f.write(b'x' * 400)
+    files.append('garbage.nii')
+    return files
+
+
+@with_tempfile(mkdir=True)
+def test_nifti_batch(path=None):
+    from datalad_neuroimaging.extractors.nifti1 import MetadataExtractor
+    ds = Dataset(path).create()
+    files = _make_nifti_files(path)
+    ds.save()
+
+    res = {}
+    for batch_size in (0, 2, 1000):
+        ds.config.set('datalad.metadata.nifti1.batch-size', str(batch_size),
+                      scope='local')
+        dsmeta, cnmeta = MetadataExtractor(ds, files).get_metadata(
+            dataset=False, content=True)
+        res[batch_size] = dsmeta, list(cnmeta)
+    # results can be buffered, without any impact on them
+    ds.config.set('datalad.metadata.nifti1.buffer', '2', scope='local')
+    buffered = list(MetadataExtractor(ds, files).get_metadata(
+        dataset=False, content=True)[1])
+    eq_([(f, list(m.items())) for f, m in buffered],
+        [(f, list(m.items())) for f, m in res[1000][1]])
+    # the batch reader produces identical metadata, including the order
+    for batch_size in (2, 1000):
+        eq_([(f, list(m.items())) for f, m in res[batch_size][1]],
+            [(f, list(m.items())) for f, m in res[0][1]])
+    eq_([f for f, m in res[0][1]],
+        ['plain.nii', 'func.nii.gz', 'hz.nii', 'bigendian.nii',
+         'badmagic.nii', 'pair.img'])
@@ -0,0 +1,95 @@
+# emacs: -*- mode: python-mode; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil; coding: utf-8 -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Test extractor utilities"""
+
+import os.path as op
+from unittest.mock import patch
+
+from datalad.tests.utils_pytest import (
+    assert_raises,
+    eq_,
+)
+
+from datalad_neuroimaging.extractors import utils
+from datalad_neuroimaging.extractors.utils import (
+    ThrottledProgress,
+    iter_buffered,
+)
+
+
+def test_iter_buffered():
+    eq_(list(iter_buffered(range(100), 3)), list(range(100)))
+    eq_(list(iter_buffered([], 3)), [])
+
+    def _failing():
+        yield 1
+        raise ValueError('bad')
+
+    it = iter_buffered(_failing(), 1)
+    eq_(next(it), 1)
+    assert_raises(ValueError, next, it)
+
+    # a producer is closed, when the consumer stops early
+    closed = []
+
+    def _endless():
+        try:
+            i = 0
+            while True:
+                yield i
+                i += 1
+        finally:
+            closed.append(True)
+
+    it = iter_buffered(_endless(), 2)
+    eq_([next(it) for i in range(5)], list(range(5)))
+    it.close()
+    eq_(closed, [True])
+
+
+def test_throttled_progress():
+    calls = []
+
+    def _log_progress(lgrcall, pid, *args, **kwargs):
+        calls.append((args, kwargs.get('update')))
+
+    with patch.object(utils, 'log_progress', _log_progress):
+        # count-based, the time limit is never reached
+        progress = ThrottledProgress(None, 'some', interval=3600, every=3)
+        progress.start('start', total=7)
+        for i in range(7):
+            progress.update('file %i', i)
+        progress.finish('done')
+        eq_(calls, [
+            (('start',), None),
+            (('file %i', 2), 3),
+            (('file %i', 5), 3),
+            # pending updates are reported before finishing
+            (('file %i', 6), 1),
+            (('done',), None),
+        ])
+        # without an interval, every update is reported
+        del calls[:]
+        progress = ThrottledProgress(None, 'some', interval=0)
+        for i in range(3):
+            progress.update('file %i', i)
+        progress.finish('done')
+        eq_([c[1] for c in calls], [1, 1, 1, None])
+        # paths of files are only made absolute when reported
+        del calls[:]
+        progress = ThrottledProgress(
+            None, 'some', interval=3600, every=2, root='/root')
+        for f in ('a', 'b', 'c'):
+            progress.update_file('file %s', f)
+        progress.finish('done')
+        eq_(calls, [
+            (('file %s', op.join('/root', 'b')), 2),
+            (('file %s', op.join('/root', 'c')), 1),
+            (('done',), None),
+        ])
@@ -0,0 +1,190 @@
+# emacs: -*- mode: python; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Utilities shared by metadata extractors"""
+
+import logging
+import os.path as op
+import queue
+import threading
+from time import monotonic
+
+from datalad.log import log_progress
+
+lgr = logging.getLogger('datalad.metadata.extractors.utils')
+
+# marks the end of the items in a buffer
+_END = object()
+
+
+def iter_buffered(iterable, size):
+    """Consume an iterable in a background thread
+
+    Items are produced ahead of time, while the consumer is still processing
+    previous items, but at most `size` items are held at any time.
+
+    Parameters
+    ----------
+    iterable : iterable
+    size : int
+      Maximum number of buffered items.
+
+    Yields
+    ------
+    Items of `iterable`, in order. Any exception raised while producing an
+    item is re-raised in the consuming thread.
+    """
+    buffer = queue.Queue(maxsize=size)
+    stop = threading.Event()
+
+    def _put(item):
+        # give up, when the consumer is gone
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce():
+        try:
+            for item in iterable:
+                if not _put((item, None)):
+                    return
+        except BaseException as e:
+            _put((_END, e))
+            return
+        finally:
+            close = getattr(iterable, 'close', None)
+            if stop.is_set() and close is not None:
+                close()
+        _put((_END, None))
+
+    producer = threading.Thread(target=_produce, daemon=True)
+    producer.start()
+    try:
+        while True:
+            item, exc = buffer.get()
+            if item is _END:
+                if exc is not None:
+                    raise exc
+                return
+            yield item
+    finally:
+        stop.set()
+        producer.join()
+
+
+class ThrottledProgress(object):
+    """Progress reporting with batched updates
+
+    Updates are accumulated and only reported, when `interval` seconds have
+    passed since the last report, or `every` updates are pending. A log
+    message is only formatted, when an update is reported.
+
+    Parameters
+    ----------
+    lgrcall : callable
+      See `log_progress()`.
+    pid : str
+      See `log_progress()`.
+    interval : float
+      Minimum time between reports in seconds. With zero, every update is
+      reported.
+    every : int
+      Number of updates after which to report regardless of the time
+      passed. Zero disables this limit.
+    root : str, optional
+      Directory that paths passed to `update_file()` are relative to.
+    """
+    def __init__(self, lgrcall, pid, interval, every=0, root=None):
+        self.lgrcall = lgrcall
+        self.pid = pid
+        self.interval = interval
+        self.every = every
+        self.root = root
+        self._pending = 0
+        self._args = None
+        self._relpath = False
+        self._last = monotonic()
+
+    def start(self, *args, **kwargs):
+        """Start reporting, arguments are passed on to `log_progress()`"""
+        log_progress(self.lgrcall, self.pid, *args, **kwargs)
+        self._last = monotonic()
+
+    def update(self, *args):
+        """Report progress by one unit
+
+        Parameters
+        ----------
+        *args
+          Log message and its arguments, for when the update is reported.
+        """
+        self._update(args, False)
+
+    def update_file(self, msg, path):
+        """Report progress by one file
+
+        Like `update()`, for a log message with the path of a file relative
+        to `root` as its only argument. The path is only joined with `root`,
+        when the update is reported.
+        """
+        self._update((msg, path), True)
+
+    def _update(self, args, relpath):
+        self._pending += 1
+        self._args = args
+        self._relpath = relpath
+        if (self.every and self._pending >= self.every) \
+                or monotonic() - self._last >= self.interval:
+            self._flush()
+
+    def finish(self, *args):
+        """Report any pending update, and finish reporting"""
+        self._flush()
+        log_progress(self.lgrcall, self.pid, *args)
+
+    def _flush(self):
+        if not self._pending:
+            return
+        args = self._args
+        if self._relpath and self.root is not None:
+            msg, path = args
+            args = (msg, op.join(self.root, path))
+        log_progress(
+            self.lgrcall,
+            self.pid,
+            *args,
+            update=self._pending,
+            increment=True)
+        self._pending = 0
+        self._last = monotonic()
+
+
+def get_progress(ds, lgrcall, pid):
+    """Return a `ThrottledProgress` as configured for a dataset
+
+    Parameters
+    ----------
+    ds : Dataset
+    lgrcall : callable
+    pid : str
+    """
+    return ThrottledProgress(
+        lgrcall,
+        pid,
+        interval=ds.config.obtain(
+            'datalad.metadata.neuroimaging.progress-interval',
+            default=0.5, valtype=float),
+        every=ds.config.obtain(
+            'datalad.metadata.neuroimaging.progress-every',
+            default=0, valtype=int),
+        root=ds.path,
+    )
@@ -0,0 +1,68 @@
+# emacs: -*- mode: python; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""remove persistent caches of metadata extractors"""
+
+__docformat__ = 'restructuredtext'
+
+
+import logging
+lgr = logging.getLogger('datalad.neuroimaging.purge_extractor_cache')
+
+from datalad.distribution.dataset import require_dataset
+from datalad.interface.base import Interface
+from datalad.interface.base import build_doc
+from datalad.support.param import Parameter
+from datalad.distribution.dataset import datasetmethod
+from datalad.interface.base import eval_results
+from datalad.distribution.dataset import EnsureDataset
+from datalad.support.constraints import EnsureNone
+
+from datalad_neuroimaging.extractors.cache import purge_cache_dir
+
+
+@build_doc
+class PurgeExtractorCache(Interface):
+    """Remove persistent caches of neuroimaging metadata extractors
+
+    Some extractors can be configured to keep information on already
+    processed files in the .git directory of a dataset, in order to speed
+    up repeated metadata extraction. This command removes all such caches.
+    """
+    _params_ = dict(
+        dataset=Parameter(
+            args=("-d", "--dataset"),
+            doc="""Dataset to remove caches from. If no dataset is given,
+            an attempt is made to identify the dataset based on the current
+            working directory.""",
+            constraints=EnsureDataset() | EnsureNone()),
+    )
+
+    @staticmethod
+    @datasetmethod(name='purge_extractor_cache')
+    @eval_results
+    def __call__(dataset=None):
+        ds = require_dataset(
+            dataset, purpose='remove extractor caches', check_installed=True)
+        removed = purge_cache_dir(ds)
+        if not removed:
+            yield dict(
+                status='notneeded',
+                message='no extractor caches found',
+                path=ds.path,
+                type='dataset',
+                action='purge_extractor_cache',
+                logger=lgr)
+            return
+        for p in removed:
+            yield dict(
+                status='ok',
+                path=p,
+                type='file',
+                action='purge_extractor_cache',
+                logger=lgr)
@@ -20,7 +20,6 @@ from datalad.api import (
 from datalad.support.exceptions import IncompleteResultsError
 from datalad.tests.utils_pytest import (
     assert_equal,
-    assert_false,
     assert_in,
     assert_not_equal,
     assert_raises,
@@ -38,6 +37,13 @@ from datalad.tests.utils_pytest import (
 )
 from datalad.utils import chpwd
 
+from datalad_neuroimaging.bids2scidata import (
+    _index_by_suffix,
+    _iter_metadata,
+    _prune_file_record,
+    _TermResolver,
+    convert,
+)
 from datalad_neuroimaging.tests.utils import get_bids_dataset
 
 skip_if_no_module('pandas')
@@ -165,6 +171,266 @@ Sample Name\tProtocol REF\tParameter Value[modality]\tAssay Name\tRaw Data File\
         open(opj(target_path, 'a_mri_t1w.txt')).read())
 
 
+def test_term_resolver():
+    dsmeta = {'metadata': {'bids': {'@context': {
+        'EchoTime': {
+            '@id': 'https://example.com/terms/EchoTime',
+            'unit': 'uo:0000010',
+            'unit_label': 'second'}}}}}
+    resolver = _TermResolver(dsmeta, maxsize=2)
+    for _ in range(3):
+        eq_(resolver.split('UO:0000010'), ('UO', 'UO:0000010'))
+    eq_((resolver.hits, resolver.misses), (2, 1))
+    for _ in range(2):
+        eq_(resolver.get_context_term('bids', 'EchoTime'),
+            (dsmeta['metadata']['bids']['@context']['EchoTime'],
+             'UO', 'UO:0000010'))
+    # the context lookup and the split of the unit
+    eq_((resolver.hits, resolver.misses), (3, 3))
+    eq_(resolver.get_context_term('bids', 'FlipAngle'), ({}, '', ''))
+    eq_(len(resolver._cache), 2)
+    # the least recently used result got evicted
+    eq_(resolver.split('UO:0000010'), ('UO', 'UO:0000010'))
+    eq_((resolver.hits, resolver.misses), (3, 6))
+
+
+def test_index_by_suffix():
+    path = '/some/ds'
+    t1w = _make_filemeta(
+        path, 'sub-01/anat/sub-01_T1w.nii.gz', 'T1w', '01',
+        EchoTime=0.003, ImageType=['ORIGINAL'])
+    t1w['metadata']['bids']['subject'].update(age=30, sex='m')
+    t1w['metadata']['bids:CogAtlasID'] = 'trm_1'
+    t1w['metadata']['dicom'] = {'Series': []}
+    bold = _make_filemeta(
+        path, 'sub-01/func/sub-01_task-nix_bold.nii.gz', 'bold', '01',
+        task='nix')
+    index = _index_by_suffix([
+        t1w,
+        _make_filemeta(path, 'sub-01/dwi/sub-01_dwi.nii.gz', 'dwi', '01'),
+        {'path': opj(path, 'README'), 'metadata': {}},
+        bold,
+    ])
+    eq_(sorted(index), ['T1w', 'bold'])
+    # only what is reported in assay tables is kept
+    eq_(index['T1w'], [{
+        'path': t1w['path'],
+        'parentds': path,
+        'metadata': {
+            'bids': {'suffix': 'T1w', 'subject': {'id': '01'},
+                     'EchoTime': 0.003},
+            'bids:CogAtlasID': 'trm_1',
+            'nifti1': {'spatial_resolution(mm)': [2.0, 2.0, 3.0]}}}])
+    eq_([f['metadata'] for f in index['bold']], [bold['metadata']])
+
+
+def _make_filemeta(path, fname, suffix, subject, **props):
+    props.update(subject={'id': subject}, suffix=suffix)
+    return {
+        'path': opj(path, fname),
+        'parentds': path,
+        'type': 'file',
+        'metadata': {
+            'bids': props,
+            'nifti1': {'spatial_resolution(mm)': [2.0, 2.0, 3.0]}}}
+
+
+@with_tempfile(mkdir=True)
+def test_convert_jobs(path=None):
+    dsmeta = {
+        'path': path,
+        'type': 'dataset',
+        'metadata': {
+            'bids': {'name': 'demo_ds', 'author': ['Betty', 'Tom']},
+            'datalad_unique_content_properties': {
+                'bids': {'subject': [{'id': '01'}, {'id': '15'}]}}}}
+    filemeta = [
+        _make_filemeta(path, 'sub-01/anat/sub-01_T1w.nii.gz', 'T1w', '01'),
+        _make_filemeta(
+            path, 'sub-01/anat/sub-01_defacemask.nii.gz', 'defacemask', '01'),
+        _make_filemeta(path, 'sub-15/anat/sub-15_T1w.nii.gz', 'T1w', '15'),
+        _make_filemeta(
+            path, 'sub-15/func/sub-15_task-nix_run-1_bold.nii.gz', 'bold',
+            '15', task='nix', run=1),
+        _make_filemeta(
+            path, 'sub-15/func/sub-15_task-nix_run-1_physio.tsv.gz', 'physio',
+            '15', task='nix', run=1, SamplingFrequency=100.0,
+            StartTime=-5.0, Columns=['cardiac', 'respiratory']),
+        _make_filemeta(path, 'sub-15/dwi/sub-15_dwi.nii.gz', 'dwi', '15'),
+    ]
+    del filemeta[4]['metadata']['nifti1']
+    tables = {}
+    for jobs, chunk_size in ((None, None), (2, None), (None, 2), (2, 1)):
+        outdir = opj(path, 'out{}_{}'.format(jobs, chunk_size))
+        info = convert(
+            dsmeta, filemeta, outdir, jobs=jobs, chunk_size=chunk_size)
+        eq_(info['assay_fname'],
+            'a_mri_t1w.txt\ta_mri_bold.txt\ta_physio.txt')
+        eq_(sorted(listdir(outdir)),
+            ['a_mri_bold.txt', 'a_mri_t1w.txt', 'a_physio.txt',
+             's_study.txt'])
+        tables[jobs, chunk_size] = {
+            f: open(opj(outdir, f)).read() for f in listdir(outdir)}
+    for t in tables.values():
+        eq_(t, tables[None, None])
+    # the defacing mask ends up with the image it was derived from only
+    assert_equal(
+        """\
+Sample Name\tProtocol REF\tParameter Value[resolution]\tTerm Source REF\tTerm Accession Number\tParameter Value[modality]\tAssay Name\tRaw Data File\tProtocol REF\tParameter Value[resolution]\tTerm Source REF\tTerm Accession Number\tParameter Value[modality]\tDerived Data File
+01\tMagnetic Resonance Imaging\t2.0x2.0x3.0\t\t\tT1w\tsub-01\tsub-01/anat/sub-01_T1w.nii.gz\tMagnetic Resonance Imaging\t2.0x2.0x3.0\t\t\tdefacemask\tsub-01/anat/sub-01_defacemask.nii.gz
+15\tMagnetic Resonance Imaging\t2.0x2.0x3.0\t\t\tT1w\tsub-15\tsub-15/anat/sub-15_T1w.nii.gz\t\t\t\t\t\t
+""",
+        tables[None, None]['a_mri_t1w.txt'])
+    assert_equal(
+        """\
+Sample Name\tProtocol REF\tParameter Value[resolution]\tTerm Source REF\tTerm Accession Number\tParameter Value[modality]\tAssay Name\tRaw Data File\tFactor Value[task]
+15\tMagnetic Resonance Imaging\t2.0x2.0x3.0\t\t\tbold\tsub-15_task-nix_run-1\tsub-15/func/sub-15_task-nix_run-1_bold.nii.gz\tnix
+""",
+        tables[None, None]['a_mri_bold.txt'])
+    # physiological recordings in a table of their own
+    assert_equal(
+        """\
+Sample Name\tProtocol REF\tParameter Value[modality]\tParameter Value[sampling frequency]\tUnit\tTerm Source REF\tTerm Accession Number\tParameter Value[start time]\tUnit\tTerm Source REF\tTerm Accession Number\tAssay Name\tRaw Data File\tFactor Value[task]
+15\tPhysiological Measurement\tphysio\t100.0\thertz\tUO\tUO:0000106\t-5.0\tsecond\tUO\tUO:0000010\tsub-15_task-nix_run-1\tsub-15/func/sub-15_task-nix_run-1_physio.tsv.gz\tnix
+""",
+        tables[None, None]['a_physio.txt'])
+
+
+@with_tempfile(mkdir=True)
+def test_assay_tables(path=None):
+    dsmeta = {
+        'path': path,
+        'type': 'dataset',
+        'metadata': {
+            'bids': {
+                'name': 'demo_ds',
+                'author': ['Betty', 'Tom'],
+                '@context': {
+                    'EchoTime': {
+                        '@id': 'https://example.com/terms/EchoTime',
+                        'unit': 'uo:0000010',
+                        'unit_label': 'second'},
+                    'RepetitionTime': {
+                        '@id': 'https://example.com/terms/RepetitionTime',
+                        'unit_label': 'second'},
+                    'Manufacturer': {
+                        '@id': 'http://purl.obolibrary.org/obo/OBI_0000050'},
+                    'ManufacturerModelName': {'@id': 'nonsense'}}},
+            'datalad_unique_content_properties': {
+                'bids': {'subject': [{'id': '01'}, {'id': '15'}]}}}}
+    filemeta = [
+        _make_filemeta(
+            path, 'sub-01/anat/sub-01_T1w.nii.gz', 'T1w', '01',
+            EchoTime=0.003, FlipAngle=8, Manufacturer='Siemens',
+            MagneticFieldStrength=3, RepetitionTime=2.3,
+            participant_id='sub-01'),
+        _make_filemeta(
+            path, 'sub-15/anat/sub-15_acq-fast_T1w.nii.gz', 'T1w', '15',
+            Manufacturer='GE', ManufacturerModelName='MR750', acq='fast'),
+        _make_filemeta(
+            path, 'sub-01/func/sub-01_task-nix_run-1_bold.nii.gz', 'bold',
+            '01', task='nix', run=1, TaskName='nix', EchoTime=0.03,
+            RepetitionTime=2.0),
+        _make_filemeta(
+            path, 'sub-15/func/sub-15_task-nix_run-1_bold.nii.gz', 'bold',
+            '15', task='nix', run=1, RepetitionTime=2.5),
+    ]
+    filemeta[0]['metadata']['nifti1'] = {}
+    filemeta[2]['metadata']['nifti1']['temporal_spacing(s)'] = 2.0
+    filemeta[2]['metadata']['bids:CogAtlasID'] = \
+        'http://www.cognitiveatlas.org/task/id/trm_4c8a834779883'
+    # in one go, and in chunks with their rows sorted separately
+    for chunk_size in (None, 1, 3):
+        outdir = opj(path, 'out{}'.format(chunk_size))
+        convert(dsmeta, filemeta, outdir, chunk_size=chunk_size)
+        assert_equal(
+            """\
+Sample Name\tProtocol REF\tParameter Value[4d spacing]\tUnit\tTerm Source REF\tTerm Accession Number\tParameter Value[resolution]\tTerm Source REF\tTerm Accession Number\tParameter Value[echo time]\tUnit\tTerm Source REF\tTerm Accession Number\tParameter Value[flip angle]\tUnit\tTerm Source REF\tTerm Accession Number\tParameter Value[modality]\tParameter Value[instrument manufacturer]\tTerm Source REF\tTerm Accession Number\tParameter Value[instrument name]\tTerm Source REF\tTerm Accession Number\tParameter Value[magnetic field strength]\tUnit\tTerm Source REF\tTerm Accession Number\tAssay Name\tRaw Data File
+sub-01\tMagnetic Resonance Imaging\t2.3\tsecond\thttps://example.com/terms\tRepetitionTime\t\t\t\t0.003\tsecond\tUO\tUO:0000010\t8.0\tdegree\tUO\tUO:0000185\tT1w\tSiemens\thttp://purl.obolibrary.org/obo\tOBI_0000050\t\t\t\t3.0\ttesla\tUO\tUO:0000228\tsub-01\tsub-01/anat/sub-01_T1w.nii.gz
+15\tMagnetic Resonance Imaging\t\t\t\t\t2.0x2.0x3.0\t\t\t\t\t\t\t\t\t\t\tT1w\tGE\thttp://purl.obolibrary.org/obo\tOBI_0000050\tMR750\t\tnonsense\t\t\t\t\tsub-15_acq-fast\tsub-15/anat/sub-15_acq-fast_T1w.nii.gz
+""",
+            open(opj(outdir, 'a_mri_t1w.txt')).read())
+        assert_equal(
+            """\
+Sample Name\tProtocol REF\tParameter Value[4d spacing]\tUnit\tTerm Source REF\tTerm Accession Number\tParameter Value[resolution]\tTerm Source REF\tTerm Accession Number\tParameter Value[echo time]\tUnit\tTerm Source REF\tTerm Accession Number\tParameter Value[modality]\tAssay Name\tRaw Data File\tFactor Value[task]\tTerm Source REF\tTerm Accession Number
+01\tMagnetic Resonance Imaging\t2.0\tsecond\t\t\t2.0x2.0x3.0\t\t\t0.03\tsecond\tUO\tUO:0000010\tbold\tsub-01_task-nix_run-1\tsub-01/func/sub-01_task-nix_run-1_bold.nii.gz\tnix\thttp://www.cognitiveatlas.org/task/id\ttrm_4c8a834779883
+15\tMagnetic Resonance Imaging\t2.5\tsecond\thttps://example.com/terms\tRepetitionTime\t2.0x2.0x3.0\t\t\t\t\t\t\tbold\tsub-15_task-nix_run-1\tsub-15/func/sub-15_task-nix_run-1_bold.nii.gz\tnix\t\t
+""",
+            open(opj(outdir, 'a_mri_bold.txt')).read())
+
+
+_bids_hierarchy_template = {
+    'ds': {
+        '.datalad': {'config': _bids_template['ds']['.datalad']['config']},
+        'participants.tsv': _bids_template['ds']['participants.tsv'],
+        'dataset_description.json':
+            _bids_template['ds']['dataset_description.json'],
+        'sub-01': {
+            'anat': {
+                'sub-01_T1w.nii.gz': ''}},
+        'phase1': {
+            'dataset_description.json':
+                _bids_template['ds']['dataset_description.json'],
+            'sub-01': {
+                'func': {
+                    'sub-01_task-nix_run-1_bold.nii.gz': ''}}},
+        'phase2': {
+            'dataset_description.json':
+                _bids_template['ds']['dataset_description.json'],
+            'sub-15': {
+                'anat': {
+                    'sub-15_T1w.nii.gz': ''},
+                'func': {
+                    'sub-15_task-nix_run-1_bold.nii.gz': ''}}}}}
+
+
+@skip_if_adjusted_branch  # fails on crippled fs test
+@known_failure_windows
+@known_failure_osx
+@with_tree(_bids_hierarchy_template)
+def test_subdatasets(path=None):
+    ds = Dataset(opj(path, 'ds')).create(force=True)
+    for sub in ('phase1', 'phase2'):
+        subds = ds.create(sub, force=True)
+        subds.config.add(
+            'datalad.metadata.nativetype', 'nifti1', scope='branch')
+        subds.config.add(
+            'datalad.metadata.nativetype', 'bids', scope='branch')
+    ds.save(recursive=True)
+    ds.aggregate_metadata(recursive=True, update_mode='all')
+    # the same records, up to what assay tables do not report
+    records = {}
+    for jobs in (None, 2):
+        records[jobs] = [
+            dict(m, **_prune_file_record(m)) if m['type'] == 'file' else m
+            for m in _iter_metadata(None, ds, jobs)]
+    eq_(records[None], records[2])
+    tables = {}
+    for jobs in (None, 2):
+        res = ds.bids2scidata(
+            repo_name="dummy",
+            repo_accession='ds1',
+            repo_url='http://example.com',
+            output=opj(path, 'out{}'.format(jobs)),
+            jobs=jobs,
+        )
+        assert_status('ok', res)
+        tables[jobs] = {
+            f: open(opj(res[0]['path'], f)).read()
+            for f in listdir(res[0]['path'])
+            if f != 'i_Investigation.txt'}
+    eq_(tables[None], tables[2])
+    # files of all datasets, relative to the dataset they are in
+    for fname, files in (
+            ('a_mri_t1w.txt', ['sub-01/anat/sub-01_T1w.nii.gz',
+                               'sub-15/anat/sub-15_T1w.nii.gz']),
+            ('a_mri_bold.txt', ['sub-01/func/sub-01_task-nix_run-1_bold.nii.gz',
+                                'sub-15/func/sub-15_task-nix_run-1_bold.nii.gz'])):
+        rows = [l.split('\t') for l in tables[None][fname].splitlines()]
+        col = rows[0].index('Raw Data File')
+        eq_([r[col] for r in rows[1:]], files)
+
+
 # TODO implement a regression test on one of our datasets, once we have
 # new aggregated metadata in any of them
 
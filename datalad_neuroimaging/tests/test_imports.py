@@ -0,0 +1,112 @@
+# emacs: -*- mode: python; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Test that importing the extension stays cheap"""
+
+import subprocess
+import sys
+
+import pytest
+
+from datalad.tests.utils_pytest import (
+    assert_in,
+    assert_not_in,
+    ok_,
+    slow,
+)
+
+# modules that must only be imported when metadata are extracted or exported
+HEAVY_MODULES = (
+    'bids',
+    'nibabel',
+    'numpy',
+    'pandas',
+    'pydicom',
+    'sqlalchemy',
+)
+
+# the modules that any extractor or command builds on, their import time
+# is not attributed to this extension
+BASE_IMPORTS = (
+    'datalad.interface.base',
+    'datalad_deprecated.metadata.extractors.base',
+    'datalad_metalad.extractors.base',
+)
+
+# maximum time for importing a module of this extension, in addition to the
+# BASE_IMPORTS, relative to the time it takes to import datalad alone on the
+# same machine. Importing any of the HEAVY_MODULES takes several times that
+IMPORT_TIME_BUDGET = 1.0
+
+MODULES = (
+    'datalad_neuroimaging',
+    'datalad_neuroimaging.bids2scidata',
+    'datalad_neuroimaging.purge_extractor_cache',
+    'datalad_neuroimaging.extractors.bids',
+    'datalad_neuroimaging.extractors.bids_dataset',
+    'datalad_neuroimaging.extractors.dicom',
+    'datalad_neuroimaging.extractors.nifti1',
+    'datalad_neuroimaging.extractors.nidm',
+)
+
+
+def get_imported_modules(module):
+    """Import a module in a new interpreter
+
+    Returns
+    -------
+    set
+      Names of all modules imported by then.
+    """
+    res = subprocess.run(
+        [sys.executable, '-c',
+         'import sys, {}; print("\\n".join(sys.modules))'.format(module)],
+        capture_output=True, text=True, check=True)
+    return set(res.stdout.splitlines())
+
+
+@pytest.mark.parametrize('module', MODULES)
+def test_import(module):
+    modules = get_imported_modules(module)
+    assert_in(module, modules)
+    for m in HEAVY_MODULES:
+        assert_not_in(m, modules)
+
+
+def get_import_times(modules):
+    """Import modules in a new interpreter and report `-X importtime` output
+
+    Returns
+    -------
+    dict
+      Self time in microseconds for every module that was imported.
+    """
+    res = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c',
+         'import {}'.format(', '.join(modules))],
+        capture_output=True, text=True, check=True)
+    times = {}
+    for line in res.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        self_time, _, name = line[len('import time:'):].split('|')
+        if self_time.strip().isdigit():
+            times[name.strip()] = int(self_time)
+    return times
+
+
+@slow
+@pytest.mark.parametrize('module', MODULES)
+def test_import_time(module):
+    base = get_import_times(BASE_IMPORTS)
+    times = get_import_times([module])
+    reference = sum(get_import_times(['datalad']).values())
+    extra = sum(t for m, t in times.items() if m not in base)
+    ok_(extra < IMPORT_TIME_BUDGET * reference,
+        msg='importing {} takes {:.0f} ms, datalad alone {:.0f} ms'.format(
+            module, extra / 1000, reference / 1000))
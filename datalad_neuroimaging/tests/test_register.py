@@ -4,3 +4,4 @@ from datalad.tests.utils_pytest import assert_result_count
 def test_register():
     import datalad.api as da
     assert hasattr(da, 'bids2scidata')
+    assert hasattr(da, 'purge_extractor_cache')